@@ -1,32 +1,314 @@
-"""
-Redis-based caching utilities for chatroom data.
-"""
-from .config import settings
-import redis
-import json
-
-redis_client = redis.Redis.from_url(settings.REDIS_URL)
-
-def get_chatrooms_cache(user_id: int):
-    """
-    Retrieve cached chatrooms for a user from Redis, or None if not cached.
-    """
-    key = f"user:{user_id}:chatrooms"
-    data = redis_client.get(key)
-    if data:
-        return json.loads(data)
-    return None
-
-def set_chatrooms_cache(user_id: int, chatrooms):
-    """
-    Cache chatrooms for a user in Redis with a TTL.
-    """
-    key = f"user:{user_id}:chatrooms"
-    redis_client.setex(key, settings.CACHE_TTL_SECONDS, json.dumps(chatrooms))
-
-def clear_chatrooms_cache(user_id: int):
-    """
-    Clear the cached chatrooms for a user in Redis.
-    """
-    key = f"user:{user_id}:chatrooms"
-    redis_client.delete(key) 
\ No newline at end of file
+"""
+Redis-based caching utilities for chatroom data and recent conversation history,
+plus a small in-process TTL cache kept coherent across workers via Redis pub/sub.
+"""
+from .config import settings
+from collections import OrderedDict
+import asyncio
+import logging
+import time
+import redis
+import json
+import orjson
+from .metrics import track_cache
+from .redis_pool import get_redis, get_async_redis, pipeline, apipeline
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+class TTLCache:
+    """
+    Small in-process LRU cache with a per-entry time-to-live.
+    With max_bytes set, values must be str/bytes and the total size is bounded as well.
+    """
+    def __init__(self, maxsize: int, ttl: float, max_bytes: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _size(self, value) -> int:
+        return len(value) if self.max_bytes is not None else 0
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if missing or expired.
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Store a value, evicting least recently used entries when over the size limits.
+        """
+        self.pop(key)
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._bytes += self._size(value)
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            _, (evicted, _) = self._data.popitem(last=False)
+            self._bytes -= self._size(evicted)
+
+    def pop(self, key):
+        """
+        Remove a key if present.
+        """
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= self._size(item[0])
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self._data.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Return hit/miss counters and the current number of entries.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._data)}
+
+# In-process caches that other workers can invalidate by name
+_local_caches = {}
+
+def register_local_cache(name: str, cache: TTLCache):
+    """
+    Register an in-process cache so invalidation messages for `name` evict from it.
+    """
+    _local_caches[name] = cache
+    track_cache(name, cache.stats)
+
+def invalidation_command(name: str, key):
+    """
+    The PUBLISH command telling every worker to evict `key` from its in-process cache `name`,
+    for use in a pipeline alongside the write that made the entry stale.
+    """
+    return ("publish", INVALIDATION_CHANNEL, json.dumps({"cache": name, "key": key}))
+
+async def publish_invalidation(name: str, key):
+    """
+    Tell every worker to evict `key` from its in-process cache `name`.
+    """
+    await apipeline(invalidation_command(name, key))
+
+def publish_invalidation_sync(name: str, key):
+    """
+    Same as publish_invalidation, for synchronous callers such as Celery tasks.
+    """
+    pipeline(invalidation_command(name, key))
+
+async def listen_for_invalidations():
+    """
+    Subscribe to the invalidation channel and evict keys from local caches until cancelled.
+    Reconnects after Redis errors; entries missed meanwhile still expire by TTL.
+    """
+    while True:
+        pubsub = get_async_redis().pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                # Poll with an explicit timeout: a plain listen() would hit the pool's socket timeout when idle
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                data = json.loads(message["data"])
+                cache = _local_caches.get(data["cache"])
+                if cache is not None:
+                    cache.pop(data["key"])
+        except redis.RedisError:
+            logger.warning("Cache invalidation listener lost its Redis connection, retrying", exc_info=True)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+# Chatroom lists are stored in Redis as a list of orjson-encoded chatrooms behind a sentinel
+# element, so an empty list can be cached and new chatrooms appended in place with RPUSHX.
+_CHATROOM_LIST_SENTINEL = b"-"
+
+_chatroom_lists = TTLCache(maxsize=settings.CHATROOM_CACHE_LOCAL_MAX_ENTRIES, ttl=settings.CHATROOM_CACHE_LOCAL_TTL_SECONDS)
+register_local_cache("chatrooms", _chatroom_lists)
+
+# In-flight chatroom list loads per event loop, keyed by user id
+_chatroom_loads = {}
+
+def _chatrooms_key(user_id: int):
+    return f"user:{user_id}:chatroom_list"
+
+def _encode_chatroom_list(items) -> bytes:
+    """
+    Join orjson-encoded chatrooms into a JSON array.
+    """
+    return b"[" + b",".join(items) + b"]"
+
+async def get_chatrooms_cache(user_id: int):
+    """
+    Retrieve a user's cached chatrooms as JSON array bytes, checking the in-process
+    tier before Redis. Returns None if not cached.
+    """
+    data = _chatroom_lists.get(user_id)
+    if data is not None:
+        return data
+    items = await get_async_redis().lrange(_chatrooms_key(user_id), 0, -1)
+    if not items:
+        return None
+    data = _encode_chatroom_list(items[1:])
+    _chatroom_lists.set(user_id, data)
+    return data
+
+async def set_chatrooms_cache(user_id: int, chatrooms) -> bytes:
+    """
+    Cache a user's chatrooms (dicts) in Redis with a TTL and in process.
+    Returns the encoded JSON array.
+    """
+    key = _chatrooms_key(user_id)
+    items = [orjson.dumps(chatroom) for chatroom in chatrooms]
+    await apipeline(
+        ("delete", key),
+        ("rpush", key, _CHATROOM_LIST_SENTINEL, *items),
+        ("expire", key, settings.CACHE_TTL_SECONDS),
+        transaction=True,
+    )
+    data = _encode_chatroom_list(items)
+    _chatroom_lists.set(user_id, data)
+    return data
+
+async def append_chatroom_cache(user_id: int, chatroom: dict):
+    """
+    Write-through a newly created chatroom: append it to the cached Redis list if one exists
+    and evict the stale in-process copies on every worker.
+    """
+    await apipeline(("rpushx", _chatrooms_key(user_id), orjson.dumps(chatroom)), invalidation_command("chatrooms", user_id))
+    _chatroom_lists.pop(user_id)
+
+async def clear_chatrooms_cache(user_id: int):
+    """
+    Clear the cached chatrooms for a user in Redis and on every worker.
+    """
+    await apipeline(("delete", _chatrooms_key(user_id)), invalidation_command("chatrooms", user_id))
+    _chatroom_lists.pop(user_id)
+
+async def _load_chatrooms(user_id: int, loader) -> bytes:
+    """
+    Recompute a user's chatroom list under a Redis lock so only one worker hits the database.
+    Workers that lose the lock wait for the winner's result, falling back to the loader on timeout.
+    """
+    lock_key = f"{_chatrooms_key(user_id)}:lock"
+    if await get_async_redis().set(lock_key, b"1", nx=True, px=settings.CHATROOM_CACHE_LOCK_TIMEOUT_MS):
+        try:
+            return await set_chatrooms_cache(user_id, await loader())
+        finally:
+            await get_async_redis().delete(lock_key)
+    deadline = time.monotonic() + settings.CHATROOM_CACHE_LOCK_TIMEOUT_MS / 1000
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.CHATROOM_CACHE_LOCK_POLL_SECONDS)
+        data = await get_chatrooms_cache(user_id)
+        if data is not None:
+            return data
+    return _encode_chatroom_list([orjson.dumps(chatroom) for chatroom in await loader()])
+
+async def get_or_load_chatrooms(user_id: int, loader) -> bytes:
+    """
+    Return a user's chatrooms as JSON array bytes from cache, or from `loader()` on a miss.
+    Concurrent misses in a worker share one load, and across workers one holds the recompute lock.
+    """
+    data = await get_chatrooms_cache(user_id)
+    if data is not None:
+        return data
+    loads = _chatroom_loads.setdefault(asyncio.get_running_loop(), {})
+    task = loads.get(user_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_chatrooms(user_id, loader))
+        loads[user_id] = task
+        task.add_done_callback(lambda _: loads.pop(user_id, None))
+    return await asyncio.shield(task)
+
+def _history_key(chatroom_id: int):
+    return f"chatroom:{chatroom_id}:history"
+
+def _summary_key(chatroom_id: int):
+    return f"chatroom:{chatroom_id}:summary"
+
+def _since_summary_keys(chatroom_id: int):
+    # Messages and characters recorded since the counters were created
+    return f"chatroom:{chatroom_id}:since_summary", f"chatroom:{chatroom_id}:since_summary_chars"
+
+async def get_history_cache(chatroom_id: int):
+    """
+    Retrieve the cached summary and recent conversation turns (oldest first) for a chatroom in one
+    round trip, as (summary, turns). The summary is a (text, through_message_id) pair, with ("", 0)
+    when the chatroom has none yet. Either is None if not cached.
+    """
+    key = _history_key(chatroom_id)
+    summary, exists, items = await apipeline(("get", _summary_key(chatroom_id)), ("exists", key), ("lrange", key, 0, -1))
+    turns = [json.loads(item) for item in items] if exists else None
+    return (tuple(json.loads(summary)) if summary is not None else None), turns
+
+async def set_history_cache(chatroom_id: int, turns):
+    """
+    Replace the cached conversation window for a chatroom with the given turns.
+    """
+    key = _history_key(chatroom_id)
+    await apipeline(
+        ("delete", key),
+        ("rpush", key, *[json.dumps(turn) for turn in turns]),
+        ("ltrim", key, -settings.HISTORY_MAX_MESSAGES, -1),
+        ("expire", key, settings.HISTORY_CACHE_TTL_SECONDS),
+        transaction=True,
+    )
+
+def _append_history_commands(chatroom_id: int, turns):
+    key = _history_key(chatroom_id)
+    messages, chars = _since_summary_keys(chatroom_id)
+    size = sum(len(part.get("text", "")) for turn in turns for part in turn["parts"])
+    return (
+        ("rpushx", key, *[json.dumps(turn) for turn in turns]),
+        ("ltrim", key, -settings.HISTORY_MAX_MESSAGES, -1),
+        ("expire", key, settings.HISTORY_CACHE_TTL_SECONDS),
+        ("incrby", messages, len(turns)),
+        ("expire", messages, settings.HISTORY_CACHE_TTL_SECONDS),
+        ("incrby", chars, size),
+        ("expire", chars, settings.HISTORY_CACHE_TTL_SECONDS),
+    )
+
+async def append_history_cache(chatroom_id: int, *turns):
+    """
+    Append turns to the cached conversation window, keeping only the most recent turns.
+    Does nothing to the window if it is not cached yet; it is backfilled on the next read.
+    Returns the running (messages, characters) counters of the chatroom, used to trigger summaries.
+    """
+    replies = await apipeline(*_append_history_commands(chatroom_id, turns), transaction=True)
+    return replies[3], replies[5]
+
+def append_history_cache_sync(chatroom_id: int, *turns):
+    """
+    Same as append_history_cache, for synchronous callers such as Celery tasks.
+    """
+    replies = pipeline(*_append_history_commands(chatroom_id, turns), transaction=True)
+    return replies[3], replies[5]
+
+async def set_summary_cache(chatroom_id: int, summary: str, through_message_id: int):
+    """
+    Cache a chatroom's summary ("" for none) and the id of the last message it covers.
+    """
+    await get_async_redis().set(_summary_key(chatroom_id), json.dumps([summary, through_message_id]), ex=settings.HISTORY_CACHE_TTL_SECONDS)
+
+def set_summary_cache_sync(chatroom_id: int, summary: str, through_message_id: int):
+    """
+    Same as set_summary_cache, for synchronous callers such as Celery tasks.
+    """
+    get_redis().set(_summary_key(chatroom_id), json.dumps([summary, through_message_id]), ex=settings.HISTORY_CACHE_TTL_SECONDS)
@@ -1,11 +1,41 @@
-"""
-Celery worker configuration for background Gemini tasks using Redis as broker and backend.
-"""
-from celery import Celery
-from .config import settings
-
-celery_app = Celery(
-    "gemini_tasks",
-    broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL
-) 
\ No newline at end of file
+"""
+Celery worker configuration for background Gemini tasks using Redis as broker and backend.
+"""
+from celery import Celery
+from .config import settings
+
+celery_app = Celery(
+    "gemini_tasks",
+    broker=settings.REDIS_URL,
+    backend=settings.REDIS_URL,
+    include=["app.gemini", "app.otp_store", "app.stripe_events", "app.summarizer"],
+)
+
+# Broker and result-backend connections follow the same pool, timeout and health-check settings as app.redis_pool
+celery_app.conf.update(
+    broker_pool_limit=settings.REDIS_MAX_CONNECTIONS,
+    broker_transport_options={
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        "retry_on_timeout": True,
+    },
+    redis_max_connections=settings.REDIS_MAX_CONNECTIONS,
+    redis_socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+    redis_socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+    redis_backend_health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+    redis_retry_on_timeout=True,
+)
+
+# Periodic jobs, run with `celery -A app.celery_worker.celery_app beat`
+celery_app.conf.beat_schedule = {
+    "purge-expired-otps": {
+        "task": "app.otp_store.purge_expired_otps",
+        "schedule": settings.OTP_PURGE_INTERVAL_SECONDS,
+    },
+    "requeue-stripe-events": {
+        "task": "app.stripe_events.requeue_stripe_events",
+        "schedule": settings.STRIPE_EVENT_REQUEUE_AFTER_SECONDS,
+    },
+} 
\ No newline at end of file
@@ -1,25 +1,119 @@
-"""
-Configuration settings for the backend application, loaded from environment variables.
-"""
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-class Settings:
-    """
-    Application settings loaded from environment variables using dotenv.
-    """
-    DATABASE_URL: str = os.getenv("DATABASE_URL")
-    REDIS_URL: str = os.getenv("REDIS_URL")
-    JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
-    JWT_ALGORITHM: str = "HS256"
-    JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
-    STRIPE_API_KEY: str = os.getenv("STRIPE_API_KEY")
-    STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET")
-    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
-    OTP_EXPIRE_MINUTES: int = 10
-    BASIC_DAILY_LIMIT: int = 5
-    CACHE_TTL_SECONDS: int = 600  
-
+"""
+Configuration settings for the backend application, loaded from environment variables.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Settings:
+    """
+    Application settings loaded from environment variables using dotenv.
+    """
+    DATABASE_URL: str = os.getenv("DATABASE_URL")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    REDIS_URL: str = os.getenv("REDIS_URL")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+    REDIS_POOL_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", "5"))
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "5"))
+    REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS", "2"))
+    REDIS_HEALTH_CHECK_INTERVAL_SECONDS: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+    REDIS_RETRIES: int = int(os.getenv("REDIS_RETRIES", "3"))
+    REDIS_RETRY_BACKOFF_BASE_SECONDS: float = float(os.getenv("REDIS_RETRY_BACKOFF_BASE_SECONDS", "0.05"))
+    REDIS_RETRY_BACKOFF_CAP_SECONDS: float = float(os.getenv("REDIS_RETRY_BACKOFF_CAP_SECONDS", "1"))
+    JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
+    JWT_ALGORITHM: str = "HS256"
+    JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    AUTH_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    AUTH_LOG_SAMPLE_RATE: float = float(os.getenv("AUTH_LOG_SAMPLE_RATE", "0.01"))
+    STARTUP_WARMUP: bool = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+    STARTUP_WARMUP_TIMEOUT_SECONDS: float = float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "5"))
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests that turn on cProfile; it profiles the whole event loop while they run, not just them
+    PROFILE_SLOW_REQUEST_MS: float = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "500"))
+    PROFILE_TOP_FUNCTIONS: int = int(os.getenv("PROFILE_TOP_FUNCTIONS", "25"))
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+    STRIPE_API_KEY: str = os.getenv("STRIPE_API_KEY")
+    STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET")
+    STRIPE_EVENT_LOCK_TIMEOUT_SECONDS: int = int(os.getenv("STRIPE_EVENT_LOCK_TIMEOUT_SECONDS", "30"))
+    STRIPE_EVENT_REQUEUE_AFTER_SECONDS: float = float(os.getenv("STRIPE_EVENT_REQUEUE_AFTER_SECONDS", "60"))
+    STRIPE_EVENT_REQUEUE_BATCH_SIZE: int = int(os.getenv("STRIPE_EVENT_REQUEUE_BATCH_SIZE", "100"))
+    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    GEMINI_API_BASE_URL: str = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+    GEMINI_HTTP2: bool = os.getenv("GEMINI_HTTP2", "true").lower() == "true"
+    GEMINI_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_CONNECT_TIMEOUT_SECONDS", "5"))
+    GEMINI_READ_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_READ_TIMEOUT_SECONDS", "60"))
+    GEMINI_MAX_CONNECTIONS: int = int(os.getenv("GEMINI_MAX_CONNECTIONS", "100"))
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    GEMINI_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+    # Comma-separated pool of API keys; falls back to GEMINI_API_KEY
+    GEMINI_API_KEYS: list = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()]
+    GEMINI_KEY_PER_MINUTE_LIMIT: int = int(os.getenv("GEMINI_KEY_PER_MINUTE_LIMIT", "0"))
+    GEMINI_KEY_COOLDOWN_SECONDS: float = float(os.getenv("GEMINI_KEY_COOLDOWN_SECONDS", "5"))
+    GEMINI_KEY_MAX_WAIT_SECONDS: float = float(os.getenv("GEMINI_KEY_MAX_WAIT_SECONDS", "10"))
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    GEMINI_RETRY_BACKOFF_BASE_SECONDS: float = float(os.getenv("GEMINI_RETRY_BACKOFF_BASE_SECONDS", "0.5"))
+    GEMINI_RETRY_BACKOFF_CAP_SECONDS: float = float(os.getenv("GEMINI_RETRY_BACKOFF_CAP_SECONDS", "8"))
+    GEMINI_RETRY_MAX_DELAY_SECONDS: float = float(os.getenv("GEMINI_RETRY_MAX_DELAY_SECONDS", "30"))
+    GEMINI_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("GEMINI_BREAKER_FAILURE_THRESHOLD", "5"))
+    GEMINI_BREAKER_RESET_SECONDS: float = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+    GEMINI_HEDGE_AFTER_MS: float = float(os.getenv("GEMINI_HEDGE_AFTER_MS", "0"))
+    GEMINI_TASK_MAX_RETRIES: int = int(os.getenv("GEMINI_TASK_MAX_RETRIES", "3"))
+    GEMINI_CACHE_ENABLED: bool = os.getenv("GEMINI_CACHE_ENABLED", "true").lower() == "true"
+    GEMINI_CACHE_TTL_SECONDS: int = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", "86400"))
+    GEMINI_CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("GEMINI_CACHE_LOCAL_TTL_SECONDS", "300"))
+    GEMINI_CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("GEMINI_CACHE_LOCAL_MAX_ENTRIES", "1000"))
+    GEMINI_CACHE_LOCAL_MAX_BYTES: int = int(os.getenv("GEMINI_CACHE_LOCAL_MAX_BYTES", str(16 * 1024 * 1024)))
+    GEMINI_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("GEMINI_CACHE_MAX_ENTRY_BYTES", str(64 * 1024)))
+    OTP_EXPIRE_MINUTES: int = 10
+    OTP_BACKEND: str = os.getenv("OTP_BACKEND", "redis")  # 'redis' or 'postgres'
+    OTP_MAX_ATTEMPTS: int = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+    OTP_LOCKOUT_MINUTES: int = int(os.getenv("OTP_LOCKOUT_MINUTES", "15"))  # Window for counting failed attempts, and lockout once over the limit
+    OTP_PURGE_BATCH_SIZE: int = int(os.getenv("OTP_PURGE_BATCH_SIZE", "1000"))
+    OTP_PURGE_INTERVAL_SECONDS: float = float(os.getenv("OTP_PURGE_INTERVAL_SECONDS", "3600"))
+    BASIC_DAILY_LIMIT: int = int(os.getenv("BASIC_DAILY_LIMIT", "5"))
+    BASIC_PER_MINUTE_LIMIT: int = int(os.getenv("BASIC_PER_MINUTE_LIMIT", "0"))
+    BASIC_BURST_CAPACITY: int = int(os.getenv("BASIC_BURST_CAPACITY", "0"))
+    BASIC_BURST_REFILL_SECONDS: float = float(os.getenv("BASIC_BURST_REFILL_SECONDS", "60"))
+    PRO_DAILY_LIMIT: int = int(os.getenv("PRO_DAILY_LIMIT", "0"))
+    PRO_PER_MINUTE_LIMIT: int = int(os.getenv("PRO_PER_MINUTE_LIMIT", "0"))
+    PRO_BURST_CAPACITY: int = int(os.getenv("PRO_BURST_CAPACITY", "0"))
+    PRO_BURST_REFILL_SECONDS: float = float(os.getenv("PRO_BURST_REFILL_SECONDS", "60"))
+    CACHE_TTL_SECONDS: int = 600  
+    CHATROOM_CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("CHATROOM_CACHE_LOCAL_TTL_SECONDS", "60"))
+    CHATROOM_CACHE_LOCAL_MAX_ENTRIES: int = int(os.getenv("CHATROOM_CACHE_LOCAL_MAX_ENTRIES", "10000"))
+    CHATROOM_CACHE_LOCK_TIMEOUT_MS: int = int(os.getenv("CHATROOM_CACHE_LOCK_TIMEOUT_MS", "3000"))
+    CHATROOM_CACHE_LOCK_POLL_SECONDS: float = float(os.getenv("CHATROOM_CACHE_LOCK_POLL_SECONDS", "0.05"))
+    TIER_CACHE_TTL_SECONDS: int = int(os.getenv("TIER_CACHE_TTL_SECONDS", "3600"))
+    TIER_CACHE_LOCAL_TTL_SECONDS: float = float(os.getenv("TIER_CACHE_LOCAL_TTL_SECONDS", "60"))
+    TIER_CACHE_MAX_ENTRIES: int = int(os.getenv("TIER_CACHE_MAX_ENTRIES", "10000"))
+    HISTORY_MAX_MESSAGES: int = int(os.getenv("HISTORY_MAX_MESSAGES", "50"))
+    HISTORY_MAX_CHARS: int = int(os.getenv("HISTORY_MAX_CHARS", "16000"))
+    HISTORY_CACHE_TTL_SECONDS: int = int(os.getenv("HISTORY_CACHE_TTL_SECONDS", "86400"))
+    HISTORY_SUMMARY_ENABLED: bool = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+    HISTORY_SUMMARY_EVERY_MESSAGES: int = int(os.getenv("HISTORY_SUMMARY_EVERY_MESSAGES", "20"))
+    HISTORY_SUMMARY_EVERY_CHARS: int = int(os.getenv("HISTORY_SUMMARY_EVERY_CHARS", "4000"))
+    HISTORY_SUMMARY_MAX_CHARS: int = int(os.getenv("HISTORY_SUMMARY_MAX_CHARS", "4000"))
+    HISTORY_SUMMARY_CHUNK_MESSAGES: int = int(os.getenv("HISTORY_SUMMARY_CHUNK_MESSAGES", "100"))
+    HISTORY_SUMMARY_LOCK_TIMEOUT_SECONDS: int = int(os.getenv("HISTORY_SUMMARY_LOCK_TIMEOUT_SECONDS", "300"))
+    MESSAGE_WRITER_FLUSH_MS: float = float(os.getenv("MESSAGE_WRITER_FLUSH_MS", "5"))
+    MESSAGE_WRITER_MAX_BATCH: int = int(os.getenv("MESSAGE_WRITER_MAX_BATCH", "100"))
+    MESSAGE_BATCH_MAX_PROMPTS: int = int(os.getenv("MESSAGE_BATCH_MAX_PROMPTS", "100"))
+    MESSAGE_BATCH_CONCURRENCY: int = int(os.getenv("MESSAGE_BATCH_CONCURRENCY", "8"))
+    MESSAGES_PAGE_SIZE: int = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+    MESSAGES_MAX_PAGE_SIZE: int = int(os.getenv("MESSAGES_MAX_PAGE_SIZE", "200"))
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+    SEARCH_MAX_PAGE_SIZE: int = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+    SEARCH_MAX_CANDIDATES: int = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+    SEARCH_SNIPPET_OPTIONS: str = os.getenv("SEARCH_SNIPPET_OPTIONS", "MaxFragments=2, MaxWords=20, MinWords=5")
+    MESSAGE_JOB_MAX_WAIT_SECONDS: float = float(os.getenv("MESSAGE_JOB_MAX_WAIT_SECONDS", "30"))
+    MESSAGE_JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("MESSAGE_JOB_POLL_INTERVAL_SECONDS", "0.25"))
+
 settings = Settings() 
\ No newline at end of file
@@ -1,11 +1,95 @@
-"""
-Database configuration for SQLAlchemy engine, session, and base model.
-"""
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import settings
-
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)  # Create SQLAlchemy engine
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)  # Session factory
-Base = declarative_base()  # Base class for models 
\ No newline at end of file
+"""
+Database configuration for SQLAlchemy engines, sessions, and base model.
+The async engine serves the API; the sync engine is used by Celery workers and schema creation.
+Engines are created on first use, so importing the app never touches the database.
+"""
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from .config import settings
+from .metrics import instrument_engine
+
+# Async drivers for each sync URL scheme
+_ASYNC_DRIVERS = {
+    "postgres://": "postgresql+asyncpg://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+def async_database_url(url: str) -> str:
+    """
+    Map a sync database URL onto the equivalent asyncio driver URL.
+    """
+    for prefix, async_prefix in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+_pool_options = dict(
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+)
+
+_engine = None
+_async_engine = None
+_sessions = sessionmaker(autocommit=False, autoflush=False)  # Session factory, bound on use
+_async_sessions = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)  # Async session factory, bound on use
+Base = declarative_base()  # Base class for models
+
+def get_engine():
+    """
+    Return the sync engine, creating it on first use. Creating it does not connect.
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(settings.DATABASE_URL, **_pool_options)
+        instrument_engine(_engine)
+    return _engine
+
+def get_async_engine():
+    """
+    Return the async engine for the API, creating it on first use. Creating it does not connect.
+    """
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(async_database_url(settings.DATABASE_URL), **_pool_options)
+        instrument_engine(_async_engine.sync_engine)
+    return _async_engine
+
+def SessionLocal():
+    """
+    Open a sync session (Celery tasks, scripts).
+    """
+    return _sessions(bind=get_engine())
+
+def AsyncSessionLocal():
+    """
+    Open an async session (API).
+    """
+    return _async_sessions(bind=get_async_engine())
+
+async def dispose_engines():
+    """
+    Close pooled connections of whichever engines were created.
+    """
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+def init_db():
+    """
+    Create any missing tables and indexes. Run once per deploy, not on every worker boot:
+        python -m app.database
+    """
+    # Through models: under `python -m` this module also runs as __main__ with its own Base
+    from . import models
+    models.Base.metadata.create_all(bind=get_engine())
+
+if __name__ == "__main__":
+    init_db()
@@ -1,30 +1,103 @@
-"""
-Integration with Gemini API for generating chat responses, including Celery background task.
-"""
-import requests
-from .config import settings
-from .celery_worker import celery_app
-
-def call_gemini_api(message: str, chat_history=None):
-    """
-    Call the Gemini API with a user message and optional chat history.
-    Returns the AI-generated response as a string.
-    """
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-    headers = {"x-goog-api-key": settings.GEMINI_API_KEY}
-    data = {
-        "contents": [{"role": "user", "parts": [{"text": message}]}]
-    }
-    if chat_history:
-        data["history"] = chat_history
-    response = requests.post(url, json=data, headers=headers)
-    if response.status_code == 200:
-        return response.json().get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-    return "[Gemini API error]"
-
-@celery_app.task
-def gemini_message_task(message: str, chat_history=None):
-    """
-    Celery task to call the Gemini API asynchronously.
-    """
-    return call_gemini_api(message, chat_history) 
\ No newline at end of file
+"""
+Integration with Gemini API for generating chat responses, including Celery background task.
+"""
+from . import models, gemini_cache
+from .celery_worker import celery_app
+from .database import SessionLocal
+from .history import record_message_sync
+from .gemini_client import GeminiError, get_gemini_client, run_sync
+from .config import settings
+
+def _build_payload(message: str, chat_history=None):
+    """
+    Build the generateContent request body for a user message and optional chat history.
+    Prior turns go first in `contents`, followed by the new user turn.
+    """
+    contents = list(chat_history or [])
+    contents.append({"role": "user", "parts": [{"text": message}]})
+    return {"contents": contents}
+
+def _extract_text(body: dict) -> str:
+    """
+    Extract the first candidate's text from a generateContent response body.
+    """
+    return body.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
+def _cacheable(text: str) -> bool:
+    """
+    Cache only non-empty replies; an empty one (e.g. a blocked prompt) would be served to every identical prompt until it expires.
+    """
+    return bool(text)
+
+async def _generate(message: str, chat_history=None):
+    return _extract_text(await get_gemini_client().generate_content(_build_payload(message, chat_history)))
+
+async def acall_gemini_api(message: str, chat_history=None):
+    """
+    Call the Gemini API with a user message and optional chat history without blocking the event loop.
+    Identical requests are served from the response cache and coalesced while in flight.
+    Returns the AI-generated response as a string; raises GeminiError if Gemini cannot answer.
+    """
+    return await gemini_cache.get_or_compute(
+        gemini_cache.cache_key(message, chat_history),
+        lambda: _generate(message, chat_history),
+        cacheable=_cacheable,
+    )
+
+async def astream_gemini_api(message: str, chat_history=None):
+    """
+    Stream the Gemini response for a user message, yielding text chunks as they arrive.
+    A cached response is yielded as a single chunk; a completed stream is added to the cache.
+    Raises GeminiError if the stream cannot be started or breaks off.
+    """
+    key = gemini_cache.cache_key(message, chat_history)
+    if settings.GEMINI_CACHE_ENABLED:
+        cached = await gemini_cache.lookup(key)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    async for chunk in get_gemini_client().stream_generate_content(_build_payload(message, chat_history)):
+        text = _extract_text(chunk)
+        if text:
+            parts.append(text)
+            yield text
+    if settings.GEMINI_CACHE_ENABLED and _cacheable("".join(parts)):
+        await gemini_cache.store(key, "".join(parts))
+
+def call_gemini_api(message: str, chat_history=None):
+    """
+    Synchronous wrapper around acall_gemini_api for Celery tasks and other non-async callers.
+    Returns the AI-generated response as a string.
+    """
+    return run_sync(acall_gemini_api(message, chat_history))
+
+@celery_app.task(bind=True)
+def gemini_message_task(self, message: str, chat_history=None, chatroom_id: int = None):
+    """
+    Celery task to call the Gemini API asynchronously.
+    When chatroom_id is given, the reply is saved as a gemini message and returned as a dict.
+    If Gemini is unavailable the task is retried later, up to GEMINI_TASK_MAX_RETRIES times; nothing is saved.
+    """
+    try:
+        response = call_gemini_api(message, chat_history)
+    except GeminiError as exc:
+        raise self.retry(exc=exc, countdown=exc.retry_after or settings.GEMINI_BREAKER_RESET_SECONDS, max_retries=settings.GEMINI_TASK_MAX_RETRIES)
+    if chatroom_id is None:
+        return response
+    db = SessionLocal()
+    try:
+        ai_msg = models.Message(chatroom_id=chatroom_id, sender="gemini", content=response)
+        db.add(ai_msg)
+        db.commit()
+        db.refresh(ai_msg)
+        record_message_sync(chatroom_id, ai_msg.id, ai_msg.sender, ai_msg.content)
+        return {
+            "chatroom_id": chatroom_id,
+            "id": ai_msg.id,
+            "sender": ai_msg.sender,
+            "content": ai_msg.content,
+            "created_at": ai_msg.created_at.isoformat(),
+        }
+    finally:
+        db.close()
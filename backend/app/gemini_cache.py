@@ -0,0 +1,99 @@
+"""
+Exact-match cache for Gemini responses: an in-process LRU tier in front of a Redis tier,
+with single-flight coalescing of concurrent identical requests.
+"""
+import asyncio
+import hashlib
+import json
+from .cache import TTLCache
+from .redis_pool import get_async_redis
+from .config import settings
+from .metrics import track_cache
+
+_local = TTLCache(
+    maxsize=settings.GEMINI_CACHE_LOCAL_MAX_ENTRIES,
+    ttl=settings.GEMINI_CACHE_LOCAL_TTL_SECONDS,
+    max_bytes=settings.GEMINI_CACHE_LOCAL_MAX_BYTES,
+)
+
+# In-flight upstream calls per event loop, keyed by cache key
+_inflight = {}
+
+_stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0}
+
+def cache_key(message: str, chat_history=None) -> str:
+    """
+    Hash the model, the whitespace-normalized prompt and the exact history into a cache key.
+    """
+    prompt = " ".join(message.split())
+    raw = json.dumps({"model": settings.GEMINI_MODEL, "prompt": prompt, "history": chat_history or []}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _redis_key(key: str) -> str:
+    return f"gemini:response:{key}"
+
+async def lookup(key: str):
+    """
+    Return a cached response from the local or Redis tier, or None.
+    """
+    text = _local.get(key)
+    if text is not None:
+        _stats["local_hits"] += 1
+        return text
+    cached = await get_async_redis().get(_redis_key(key))
+    if cached is not None:
+        _stats["redis_hits"] += 1
+        text = cached.decode()
+        _local.set(key, text)
+        return text
+    return None
+
+async def store(key: str, text: str):
+    """
+    Store a response in both tiers, skipping entries larger than the per-entry limit.
+    """
+    if len(text.encode()) > settings.GEMINI_CACHE_MAX_ENTRY_BYTES:
+        return
+    _local.set(key, text)
+    await get_async_redis().set(_redis_key(key), text, ex=settings.GEMINI_CACHE_TTL_SECONDS)
+
+async def _fill(key: str, compute, cacheable):
+    text = await lookup(key)
+    if text is not None:
+        return text
+    _stats["misses"] += 1
+    text = await compute()
+    if cacheable(text):
+        await store(key, text)
+    return text
+
+async def get_or_compute(key: str, compute, cacheable=lambda text: True) -> str:
+    """
+    Return the cached response for key, or run `compute()` once for all concurrent callers.
+    The upstream call runs in its own task, so a cancelled caller does not cancel it for the others.
+    """
+    if not settings.GEMINI_CACHE_ENABLED:
+        return await compute()
+    text = _local.get(key)
+    if text is not None:
+        _stats["local_hits"] += 1
+        return text
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fill(key, compute, cacheable))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    else:
+        _stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+def stats() -> dict:
+    """
+    Return hit/miss counters for this process, with the overall hit ratio.
+    """
+    lookups = _stats["local_hits"] + _stats["redis_hits"] + _stats["misses"]
+    hits = _stats["local_hits"] + _stats["redis_hits"]
+    return {**_stats, "hits": hits, "hit_ratio": hits / lookups if lookups else 0.0}
+
+track_cache("gemini", stats)
@@ -0,0 +1,382 @@
+"""
+Async HTTP client for the Gemini API with a shared keep-alive connection pool and a concurrency cap.
+Upstream failures are retried with jittered exponential backoff (honoring Retry-After), a circuit
+breaker fails fast while Gemini is degraded, requests are spread over a pool of API keys with
+per-key budgets, and slow generateContent calls can be hedged with a second request.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import aclosing
+from email.utils import parsedate_to_datetime
+import httpx
+from .config import settings
+from .metrics import GEMINI_CIRCUIT_OPEN, GEMINI_HEDGES, GEMINI_RETRIES, observe_gemini
+
+# Upstream statuses worth retrying; other 4xx mean the request itself is wrong
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    """
+    A Gemini call failed after retries, or was refused without calling upstream
+    (circuit breaker open, every API key out of budget). retry_after is a hint in seconds.
+    """
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _retry_after(response) -> float:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date; None if absent or invalid.
+    """
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    # Counted by the circuit breaker: Gemini itself is unhealthy, not our request or one key's quota
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+class _ApiKey:
+    """
+    One API key with its in-flight count, a token-bucket request budget and a 429 cooldown.
+    """
+    def __init__(self, key: str, per_minute: int):
+        self.key = key
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+    def wait_seconds(self, now: float) -> float:
+        """
+        Seconds until this key may send another request; 0 if it may send now.
+        """
+        wait = max(0.0, self.cooldown_until - now)
+        if self.per_minute > 0:
+            self.tokens = min(float(self.per_minute), self.tokens + (now - self.updated) * self.per_minute / 60)
+            self.updated = now
+            if self.tokens < 1:
+                wait = max(wait, (1 - self.tokens) * 60 / self.per_minute)
+        return wait
+
+class KeyPool:
+    """
+    Spreads requests over the configured API keys: the least-loaded key with budget left wins,
+    round-robin among ties. Keys answered with 429 cool down for Retry-After (or GEMINI_KEY_COOLDOWN_SECONDS).
+    Budgets are per process, so set GEMINI_KEY_PER_MINUTE_LIMIT to a key's quota divided by the worker count.
+    """
+    def __init__(self, keys, per_minute: int):
+        self._keys = [_ApiKey(key, per_minute) for key in keys]
+        self._next = 0
+
+    async def acquire(self) -> _ApiKey:
+        """
+        Reserve a key for one request, waiting up to GEMINI_KEY_MAX_WAIT_SECONDS for budget.
+        """
+        while True:
+            now = time.monotonic()
+            ready, soonest = [], None
+            for i in range(len(self._keys)):
+                key = self._keys[(self._next + i) % len(self._keys)]
+                wait = key.wait_seconds(now)
+                if wait == 0:
+                    ready.append(key)
+                elif soonest is None or wait < soonest:
+                    soonest = wait
+            if ready:
+                # min() keeps the first of equally loaded keys, i.e. the next one in round-robin order
+                key = min(ready, key=lambda k: k.in_flight)
+                self._next = (self._keys.index(key) + 1) % len(self._keys)
+                if key.per_minute > 0:
+                    key.tokens -= 1
+                key.in_flight += 1
+                return key
+            if soonest > settings.GEMINI_KEY_MAX_WAIT_SECONDS:
+                raise GeminiError("Every Gemini API key is out of budget", retry_after=soonest)
+            await asyncio.sleep(soonest)
+
+    def release(self, key: _ApiKey, cooldown: float = None):
+        """
+        Return a key after its request, optionally cooling it down for `cooldown` seconds.
+        """
+        key.in_flight -= 1
+        if cooldown is not None:
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+
+class CircuitBreaker:
+    """
+    Opens after GEMINI_BREAKER_FAILURE_THRESHOLD consecutive upstream failures and then refuses calls
+    for GEMINI_BREAKER_RESET_SECONDS. After that one probe call is let through: success closes it,
+    failure opens it again. A threshold of 0 disables it.
+    """
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def closed(self) -> bool:
+        return self.opened_at is None
+
+    def before_call(self):
+        """
+        Raise GeminiError if calls are currently refused; otherwise let this one through.
+        """
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if remaining > 0 or self.probing:
+            raise GeminiError("Gemini is unavailable (circuit breaker open)", retry_after=max(remaining, 1.0))
+        self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.opened_at is not None:
+            self.opened_at = None
+            GEMINI_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.threshold > 0 and (self.probing or self.failures >= self.threshold):
+            self.opened_at = time.monotonic()
+            self.probing = False
+            GEMINI_CIRCUIT_OPEN.set(1)
+
+    def record_abandoned(self):
+        # A call that never got an answer (the losing hedge, no key budget) tells us nothing; free the probe slot
+        self.probing = False
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """
+    Return how long to wait before retrying after `exc`, or raise GeminiError if it should not be retried.
+    Uses full-jitter exponential backoff. A 429 only cools down the key that got it, so the retry
+    goes to another key; a Retry-After on other statuses applies to every key.
+    """
+    response = exc.response if isinstance(exc, httpx.HTTPStatusError) else None
+    retry_after = _retry_after(response)
+    retryable = isinstance(exc, httpx.TransportError) or (response is not None and response.status_code in RETRYABLE_STATUSES)
+    if not retryable or attempt >= settings.GEMINI_MAX_RETRIES:
+        raise GeminiError(f"Gemini request failed: {exc!r}", retry_after=retry_after) from exc
+    delay = random.uniform(0, min(settings.GEMINI_RETRY_BACKOFF_CAP_SECONDS, settings.GEMINI_RETRY_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None and response.status_code != 429:
+        delay = max(delay, retry_after)
+    if delay > settings.GEMINI_RETRY_MAX_DELAY_SECONDS:
+        raise GeminiError(f"Gemini asked to retry after {delay:.0f}s", retry_after=delay) from exc
+    GEMINI_RETRIES.labels(str(response.status_code) if response is not None else "transport").inc()
+    return delay
+
+class GeminiClient:
+    """
+    Pooled HTTP/2 client for the Gemini REST API, bound to a single event loop.
+    Limits the number of in-flight upstream calls with a semaphore; every call goes through
+    the circuit breaker, the key pool and the retry policy. Failures raise GeminiError.
+    """
+    def __init__(self):
+        self._http = httpx.AsyncClient(
+            base_url=settings.GEMINI_API_BASE_URL,
+            http2=settings.GEMINI_HTTP2,
+            timeout=httpx.Timeout(settings.GEMINI_READ_TIMEOUT_SECONDS, connect=settings.GEMINI_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        self._keys = KeyPool(settings.GEMINI_API_KEYS or [settings.GEMINI_API_KEY or ""], settings.GEMINI_KEY_PER_MINUTE_LIMIT)
+        self._breaker = CircuitBreaker(settings.GEMINI_BREAKER_FAILURE_THRESHOLD, settings.GEMINI_BREAKER_RESET_SECONDS)
+
+    def _finish(self, key: _ApiKey, exc: BaseException = None):
+        """
+        Release the key and feed the outcome of one upstream attempt to the breaker.
+        """
+        cooldown = None
+        if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+            cooldown = _retry_after(exc.response) or settings.GEMINI_KEY_COOLDOWN_SECONDS
+        self._keys.release(key, cooldown)
+        if exc is None:
+            self._breaker.record_success()
+        elif isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            self._breaker.record_abandoned()
+        elif _is_upstream_failure(exc):
+            self._breaker.record_failure()
+        else:
+            # 4xx and 429: Gemini answered, so it is up
+            self._breaker.record_success()
+
+    async def _acquire_key(self) -> _ApiKey:
+        # Admit the call through the breaker, then wait for a key. A half-open probe that never
+        # reaches Gemini (out of key budget, cancelled) must release the probe slot
+        self._breaker.before_call()
+        try:
+            return await self._keys.acquire()
+        except BaseException:
+            self._breaker.record_abandoned()
+            raise
+
+    async def _generate_once(self, payload: dict) -> dict:
+        key = await self._acquire_key()
+        started = time.perf_counter()
+        try:
+            async with self._semaphore:
+                # Time the upstream call itself, not the wait for a slot
+                started = time.perf_counter()
+                response = await self._http.post(
+                    f"/models/{settings.GEMINI_MODEL}:generateContent", json=payload, headers={"x-goog-api-key": key.key}
+                )
+            response.raise_for_status()
+            body = response.json()
+        except BaseException as exc:
+            self._finish(key, exc)
+            if not isinstance(exc, asyncio.CancelledError):
+                observe_gemini("generate", "error", time.perf_counter() - started)
+            raise
+        self._finish(key)
+        observe_gemini("generate", "ok", time.perf_counter() - started, body)
+        return body
+
+    async def _generate_hedged(self, payload: dict) -> dict:
+        """
+        Send the request and, if it has not finished after GEMINI_HEDGE_AFTER_MS, a second copy;
+        return whichever succeeds first and cancel the other.
+        """
+        if settings.GEMINI_HEDGE_AFTER_MS <= 0 or not self._breaker.closed:
+            return await self._generate_once(payload)
+        tasks = {asyncio.ensure_future(self._generate_once(payload))}
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=settings.GEMINI_HEDGE_AFTER_MS / 1000)
+            if not done:
+                GEMINI_HEDGES.inc()
+                tasks.add(asyncio.ensure_future(self._generate_once(payload)))
+            pending = tasks
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_content(self, payload: dict) -> dict:
+        """
+        POST a generateContent request and return the decoded JSON body, retrying upstream failures.
+        Raises GeminiError when the call cannot be completed.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self._generate_hedged(payload)
+            except httpx.HTTPError as exc:
+                delay = _retry_delay(exc, attempt)
+            except ValueError as exc:
+                raise GeminiError("Gemini returned an invalid response") from exc
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _stream_once(self, payload: dict):
+        key = await self._acquire_key()
+        started = time.perf_counter()
+        # usageMetadata arrives on the final chunk
+        chunk, error = None, None
+        try:
+            async with self._semaphore:
+                async with self._http.stream(
+                    "POST", f"/models/{settings.GEMINI_MODEL}:streamGenerateContent",
+                    params={"alt": "sse"}, json=payload, headers={"x-goog-api-key": key.key},
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.startswith("data:"):
+                            chunk = json.loads(line[5:])
+                            yield chunk
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            self._finish(key, error)
+            observe_gemini("stream", "ok" if error is None else "error", time.perf_counter() - started, chunk)
+
+    async def stream_generate_content(self, payload: dict):
+        """
+        POST a streamGenerateContent request and yield each decoded SSE chunk as it arrives.
+        Failures before the first chunk are retried; raises GeminiError when the stream cannot be
+        started or breaks off midway.
+        """
+        attempt = 0
+        while True:
+            started_yielding = False
+            try:
+                async with aclosing(self._stream_once(payload)) as chunks:
+                    async for chunk in chunks:
+                        started_yielding = True
+                        yield chunk
+                return
+            except (httpx.HTTPError, ValueError) as exc:
+                if started_yielding or isinstance(exc, ValueError):
+                    raise GeminiError("Gemini stream was interrupted") from exc
+                delay = _retry_delay(exc, attempt)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """
+        Close all pooled connections.
+        """
+        await self._http.aclose()
+
+# One client per event loop: httpx connections cannot be shared across loops.
+_clients = {}
+
+def get_gemini_client() -> GeminiClient:
+    """
+    Return the shared Gemini client for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = GeminiClient()
+    return client
+
+async def close_gemini_client():
+    """
+    Close the Gemini client bound to the running event loop, if any.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+_bridge_loop = None
+_bridge_lock = threading.Lock()
+
+def run_sync(coro):
+    """
+    Run a coroutine on a private background event loop and block until it completes.
+    Lets synchronous callers (e.g. Celery tasks) reuse the pooled async client.
+    """
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            _bridge_loop = asyncio.new_event_loop()
+            threading.Thread(target=_bridge_loop.run_forever, name="gemini-sync-bridge", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _bridge_loop).result()
@@ -0,0 +1,64 @@
+"""
+Password hashing off the event loop: bcrypt runs in a small dedicated process pool,
+with a bound on queued work so a burst of hashes is rejected instead of piling up.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from . import utils
+from .config import settings
+
+_executor = None
+_pending = 0
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: the API process runs threads (event loop, Redis), which fork does not copy safely
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+async def _run(fn, *args):
+    """
+    Run fn in the hashing pool, or raise HTTP 503 if PASSWORD_HASH_MAX_PENDING jobs are already queued.
+    """
+    global _pending
+    if _pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password service busy, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+async def hash_password(password: str) -> str:
+    """
+    Hash a plain password with bcrypt at the configured cost.
+    """
+    return await _run(utils.hash_password, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a plain password against a hash.
+    Returns (valid, new_hash); new_hash is set when the stored hash used a different
+    cost than BCRYPT_ROUNDS and should be saved in place of the old one.
+    """
+    return await _run(utils.verify_and_update_password, plain_password, hashed_password)
+
+def shutdown_executor():
+    """
+    Stop the hashing pool's worker processes.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
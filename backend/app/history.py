@@ -0,0 +1,142 @@
+"""
+Assembly of conversation history for Gemini prompts, backed by a per-chatroom Redis window.
+Older messages are folded into a rolling summary by app.summarizer, so prompts stay bounded.
+"""
+import logging
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .cache import get_history_cache, set_history_cache, set_summary_cache, append_history_cache, append_history_cache_sync
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Message.sender values mapped to Gemini content roles
+ROLE_BY_SENDER = {"user": "user", "gemini": "model"}
+
+def message_turn(sender: str, content: str) -> dict:
+    """
+    Convert a stored message into a Gemini `contents` turn.
+    """
+    return {"role": ROLE_BY_SENDER.get(sender, "user"), "parts": [{"text": content}]}
+
+def _cached_turn(message_id: int, sender: str, content: str) -> dict:
+    # Cached turns carry the message id, so turns already covered by the summary can be skipped
+    return {"id": message_id, **message_turn(sender, content)}
+
+async def load_history(db: AsyncSession, chatroom_id: int):
+    """
+    Return the chatroom's summary as (text, through_message_id), ("", 0) if none, and its recent
+    cached turns, oldest first. Reads Redis and only falls back to bounded queries on a cache miss.
+    """
+    summary, turns = await get_history_cache(chatroom_id)
+    if turns is None:
+        rows = (await db.execute(
+            select(models.Message.id, models.Message.sender, models.Message.content)
+            .filter(models.Message.chatroom_id == chatroom_id)
+            .order_by(models.Message.id.desc())
+            .limit(settings.HISTORY_MAX_MESSAGES)
+        )).all()
+        turns = [_cached_turn(message_id, sender, content) for message_id, sender, content in reversed(rows)]
+        if turns:
+            await set_history_cache(chatroom_id, turns)
+    if summary is None:
+        row = (await db.execute(
+            select(models.ChatroomSummary.summary, models.ChatroomSummary.through_message_id)
+            .filter(models.ChatroomSummary.chatroom_id == chatroom_id)
+        )).first()
+        summary = tuple(row) if row else ("", 0)
+        await set_summary_cache(chatroom_id, *summary)
+    return summary, turns
+
+def summary_turns(summary: str):
+    """
+    Present a chatroom summary to Gemini as a leading user/model exchange.
+    """
+    return [
+        {"role": "user", "parts": [{"text": f"Summary of our earlier conversation:\n{summary}"}]},
+        {"role": "model", "parts": [{"text": "Understood, I will keep that in mind."}]},
+    ]
+
+def trim_history(turns, max_chars: int = None):
+    """
+    Keep the newest turns whose combined text fits within the character budget.
+    The result always starts with a user turn, as Gemini expects.
+    """
+    budget = settings.HISTORY_MAX_CHARS if max_chars is None else max_chars
+    total = 0
+    start = len(turns)
+    for i in range(len(turns) - 1, -1, -1):
+        size = sum(len(part.get("text", "")) for part in turns[i]["parts"])
+        if total + size > budget:
+            break
+        total += size
+        start = i
+    while start < len(turns) and turns[start]["role"] != "user":
+        start += 1
+    return turns[start:]
+
+async def build_history(db: AsyncSession, chatroom_id: int):
+    """
+    Return the prior turns for a chatroom trimmed to the configured budget,
+    led by the summary of older messages when there is one.
+    Only turns newer than the summary are included, so nothing is sent twice.
+    """
+    (summary, through_id), cached = await load_history(db, chatroom_id)
+    turns = [{"role": turn["role"], "parts": turn["parts"]} for turn in cached if turn["id"] > through_id]
+    if not summary:
+        return trim_history(turns)
+    return summary_turns(summary) + trim_history(turns, max(settings.HISTORY_MAX_CHARS - len(summary), 0))
+
+def _crossed(total: int, added: int, every: int) -> bool:
+    # True when the last `added` units took the running total past a multiple of `every`
+    return every > 0 and total // every > (total - added) // every
+
+def _summary_due(counters, added_messages: int, added_chars: int) -> bool:
+    """
+    A summary refresh is due every HISTORY_SUMMARY_EVERY_MESSAGES messages or HISTORY_SUMMARY_EVERY_CHARS
+    characters. app.summarizer keeps that much headroom in the prompt, so no unsummarized turn is
+    trimmed from it between two refreshes.
+    """
+    messages, chars = counters
+    return settings.HISTORY_SUMMARY_ENABLED and (
+        _crossed(messages, added_messages, settings.HISTORY_SUMMARY_EVERY_MESSAGES)
+        or _crossed(chars, added_chars, settings.HISTORY_SUMMARY_EVERY_CHARS)
+    )
+
+def _enqueue_summary(chatroom_id: int):
+    """
+    Queue a summary refresh. Best effort: the messages are already saved, so a broker
+    failure is logged and the next trigger tries again.
+    """
+    # Imported here: app.summarizer imports app.gemini, which imports this module
+    from .summarizer import summarize_chatroom
+    try:
+        summarize_chatroom.delay(chatroom_id)
+    except Exception:
+        logger.warning("Could not queue summary of chatroom %s", chatroom_id, exc_info=True)
+
+async def record_messages(chatroom_id: int, messages):
+    """
+    Append newly saved messages (dicts with id, sender and content, as returned by the message
+    writer) to the chatroom's cached history window in one round trip, queueing a summary refresh
+    when one is due.
+    """
+    turns = [_cached_turn(message["id"], message["sender"], message["content"]) for message in messages]
+    counters = await append_history_cache(chatroom_id, *turns)
+    if _summary_due(counters, len(messages), sum(len(message["content"]) for message in messages)):
+        await run_in_threadpool(_enqueue_summary, chatroom_id)
+
+async def record_message(chatroom_id: int, message: dict):
+    """
+    Append a newly saved message to the chatroom's cached history window.
+    """
+    await record_messages(chatroom_id, [message])
+
+def record_message_sync(chatroom_id: int, message_id: int, sender: str, content: str):
+    """
+    Same as record_message, for synchronous callers such as Celery tasks.
+    """
+    if _summary_due(append_history_cache_sync(chatroom_id, _cached_turn(message_id, sender, content)), 1, len(content)):
+        _enqueue_summary(chatroom_id)
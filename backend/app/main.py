@@ -1,32 +1,89 @@
-"""
-Main entry point for the Gemini-style backend system using FastAPI.
-Initializes middleware, routers, and database models.
-"""
-from fastapi import FastAPI
-from .middleware import RateLimitMiddleware
-from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, user, chatroom, subscription
-from app.database import engine
-from app import models
-
-app = FastAPI()
-
-app.add_middleware(RateLimitMiddleware)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.include_router(auth.router)
-app.include_router(user.router)
-app.include_router(chatroom.router)
-app.include_router(subscription.router)
-
-models.Base.metadata.create_all(bind=engine)
-
-@app.get("/")
-def root():
-    return {"message": "Gemini-style backend system running."} 
\ No newline at end of file
+"""
+Main entry point for the Gemini-style backend system using FastAPI.
+Initializes middleware and routers; connections are opened in the lifespan, not at import.
+Tables are created by `python -m app.database`, not on worker boot.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from sqlalchemy import text
+from .middleware import RateLimitMiddleware
+from .metrics import MetricsMiddleware, render_metrics
+from fastapi.middleware.cors import CORSMiddleware
+from .routers import auth, user, chatroom, subscription
+from app.config import settings
+from app.database import get_async_engine, dispose_engines
+from app.gemini_client import get_gemini_client, close_gemini_client
+from app.hashing import shutdown_executor
+from app.message_writer import close_message_writer
+from app.cache import listen_for_invalidations
+from app.redis_pool import close_async_redis, pool_stats, warm_up_async_redis
+
+logger = logging.getLogger(__name__)
+
+async def warm_up():
+    """
+    Open a first database and Redis connection and build the Gemini client, so the first
+    requests do not pay for it. Failures are logged; the pools retry on first use.
+    """
+    async def database():
+        async with get_async_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    get_gemini_client()
+    results = await asyncio.gather(
+        asyncio.wait_for(database(), settings.STARTUP_WARMUP_TIMEOUT_SECONDS),
+        asyncio.wait_for(warm_up_async_redis(), settings.STARTUP_WARMUP_TIMEOUT_SECONDS),
+        return_exceptions=True,
+    )
+    for name, result in zip(("database", "redis"), results):
+        if isinstance(result, BaseException):
+            logger.warning("Warm-up of %s failed: %r", name, result)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.STARTUP_WARMUP:
+        await warm_up()
+    # Keep in-process caches coherent with changes made on other workers
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    try:
+        yield
+    finally:
+        invalidation_listener.cancel()
+        await close_message_writer()
+        await close_gemini_client()
+        shutdown_executor()
+        await close_async_redis()
+        await dispose_engines()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+# Outermost, so latency includes the other middleware and rate-limited responses
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(auth.router)
+app.include_router(user.router)
+app.include_router(chatroom.router)
+app.include_router(subscription.router)
+
+@app.get("/")
+def root():
+    return {"message": "Gemini-style backend system running."}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/health/redis")
+def redis_health():
+    return pool_stats()
@@ -0,0 +1,117 @@
+"""
+Group commit for chat messages: inserts from concurrent requests are buffered briefly and
+written in one multi-row INSERT ... RETURNING per transaction.
+"""
+import asyncio
+from datetime import datetime
+from sqlalchemy import insert
+from . import models
+from .config import settings
+from .database import AsyncSessionLocal
+
+class MessageWriter:
+    """
+    Buffers Message inserts on one event loop and flushes them when the batch reaches
+    MESSAGE_WRITER_MAX_BATCH rows or MESSAGE_WRITER_FLUSH_MS after the first buffered row.
+    """
+    def __init__(self):
+        self._buffer = []
+        self._timer = None
+        self._flushes = set()
+
+    async def write(self, chatroom_id: int, sender: str, content: str) -> dict:
+        """
+        Queue a message and wait until its batch is committed.
+        Returns the saved message as a dict with id, sender, content and created_at.
+        """
+        return (await self.write_many(chatroom_id, [(sender, content)]))[0]
+
+    async def write_many(self, chatroom_id: int, messages) -> list:
+        """
+        Queue several (sender, content) messages for one chatroom and wait until they are committed.
+        They are buffered together, so they are inserted in order in the same batch.
+        """
+        loop = asyncio.get_running_loop()
+        created_at = datetime.utcnow()
+        futures = []
+        for sender, content in messages:
+            future = loop.create_future()
+            self._buffer.append(({"chatroom_id": chatroom_id, "sender": sender, "content": content, "created_at": created_at}, future))
+            futures.append(future)
+        if len(self._buffer) >= settings.MESSAGE_WRITER_MAX_BATCH:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(settings.MESSAGE_WRITER_FLUSH_MS / 1000, self._start_flush)
+        # The batch completes even if this caller goes away
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    insert(models.Message).returning(models.Message.id, sort_by_parameter_order=True),
+                    rows,
+                )
+                ids = result.scalars().all()
+                await db.commit()
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (row, future), message_id in zip(batch, ids):
+            if not future.done():
+                future.set_result({"id": message_id, "sender": row["sender"], "content": row["content"], "created_at": row["created_at"]})
+
+    async def aclose(self):
+        """
+        Flush anything still buffered and wait for in-progress batches.
+        """
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+# One writer per event loop: the async engine's connections are bound to the loop that opened them.
+_writers = {}
+
+def get_message_writer() -> MessageWriter:
+    """
+    Return the message writer for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter()
+    return writer
+
+async def save_message(chatroom_id: int, sender: str, content: str) -> dict:
+    """
+    Persist a message through the group-commit writer and return it as a dict.
+    """
+    return await get_message_writer().write(chatroom_id, sender, content)
+
+async def save_messages(chatroom_id: int, messages) -> list:
+    """
+    Persist several (sender, content) messages together through the group-commit writer,
+    returning them as dicts in the same order.
+    """
+    return await get_message_writer().write_many(chatroom_id, messages)
+
+async def close_message_writer():
+    """
+    Drain the message writer bound to the running event loop, if any.
+    """
+    writer = _writers.pop(asyncio.get_running_loop(), None)
+    if writer is not None:
+        await writer.aclose()
@@ -0,0 +1,239 @@
+"""
+Prometheus metrics for the hot path: per-route latency, in-flight requests, SQL and Redis timings,
+Gemini calls and tokens, rate-limit rejections and cache hit ratios, plus sampled request profiling.
+"""
+import bisect
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from prometheus_client.utils import INF, floatToGoString
+from sqlalchemy import event
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Fine-grained buckets for calls that are usually sub-millisecond
+_FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Duration of individual SQL statements", buckets=_FAST_BUCKETS)
+REDIS_COMMAND_LATENCY = Histogram("redis_command_duration_seconds", "Redis round-trip latency by command (pipelines count once)", ["command"], buckets=_FAST_BUCKETS)
+GEMINI_LATENCY = Histogram("gemini_request_duration_seconds", "Gemini API call latency", ["method", "outcome"], buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60))
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Tokens reported by Gemini usageMetadata", ["kind"])
+GEMINI_RETRIES = Counter("gemini_retries_total", "Gemini attempts retried, by upstream status or 'transport'", ["reason"])
+GEMINI_HEDGES = Counter("gemini_hedged_requests_total", "Hedged second requests sent to Gemini")
+GEMINI_CIRCUIT_OPEN = Gauge("gemini_circuit_open", "1 while the Gemini circuit breaker is open on some worker loop")
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter", ["tier", "rule"])
+
+# [statement count, seconds] for the request being served; tasks it spawns share the same list
+_request_db = contextvars.ContextVar("request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.observe(elapsed)
+    totals = _request_db.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+
+def instrument_engine(engine):
+    """
+    Time every SQL statement run on a (sync) engine; pass async_engine.sync_engine for async engines.
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+_redis_children = {}
+
+def observe_redis(command: str, elapsed: float):
+    """
+    Record one Redis round trip.
+    """
+    child = _redis_children.get(command)
+    if child is None:
+        child = _redis_children[command] = REDIS_COMMAND_LATENCY.labels(command)
+    child.observe(elapsed)
+
+def observe_gemini(method: str, outcome: str, elapsed: float, body: dict = None):
+    """
+    Record a Gemini call and the token counts from its usageMetadata, if present.
+    """
+    GEMINI_LATENCY.labels(method, outcome).observe(elapsed)
+    usage = (body or {}).get("usageMetadata")
+    if usage:
+        GEMINI_TOKENS.labels("prompt").inc(usage.get("promptTokenCount", 0))
+        GEMINI_TOKENS.labels("candidates").inc(usage.get("candidatesTokenCount", 0))
+
+# Cache name -> callable returning {"hits": int, "misses": int}
+_caches = {}
+
+def track_cache(name: str, stats):
+    """
+    Export hit/miss counters and the hit ratio of a cache under `name`.
+    """
+    _caches[name] = stats
+
+class _CacheCollector:
+    """
+    Reads cache counters at scrape time, so lookups pay nothing beyond their own counters.
+    """
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hits / lookups since process start", labels=["cache"])
+        for name, stats in list(_caches.items()):
+            counts = stats()
+            lookups = counts["hits"] + counts["misses"]
+            hits.add_metric([name], counts["hits"])
+            misses.add_metric([name], counts["misses"])
+            ratio.add_metric([name], counts["hits"] / lookups if lookups else 0.0)
+        yield hits
+        yield misses
+        yield ratio
+
+REGISTRY.register(_CacheCollector())
+
+def render_metrics():
+    """
+    Return (body, content type) of the Prometheus text exposition.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+_profiling = False
+
+def _should_profile() -> bool:
+    # cProfile allows one active profiler per thread; this only prevents overlap, it does not isolate a request
+    return settings.PROFILE_SAMPLE_RATE > 0 and not _profiling and random.random() < settings.PROFILE_SAMPLE_RATE
+
+def _report_profile(profiler, method: str, route: str, elapsed: float):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(settings.PROFILE_TOP_FUNCTIONS)
+    logger.warning("Slow request %s %s took %.1f ms\n%s", method, route, elapsed * 1000, out.getvalue())
+
+class _PlainHistogram:
+    """
+    Histogram kept as plain counters and exported at scrape time. Observing is a bisect and two
+    additions, with none of the locking of prometheus_client metrics; only the event loop thread
+    (MetricsMiddleware) may observe.
+    """
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def buckets(self):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield floatToGoString(bound), cumulative
+
+_LATENCY_BOUNDS = Histogram.DEFAULT_BUCKETS
+_DB_QUERY_BOUNDS = (0, 1, 2, 3, 5, 8, 13, 21, 50, INF)
+_DB_TIME_BOUNDS = _FAST_BUCKETS + (INF,)
+
+# (method, route, status) -> latency histogram; route -> (SQL statements, SQL time) histograms; method -> in flight
+_latency = {}
+_db_usage = {}
+_in_progress = {}
+
+def _latency_histogram(method: str, route: str, status: int) -> _PlainHistogram:
+    histogram = _latency.get((method, route, status))
+    if histogram is None:
+        histogram = _latency[(method, route, status)] = _PlainHistogram(_LATENCY_BOUNDS)
+    return histogram
+
+def _db_histograms(route: str):
+    histograms = _db_usage.get(route)
+    if histograms is None:
+        histograms = _db_usage[route] = (_PlainHistogram(_DB_QUERY_BOUNDS), _PlainHistogram(_DB_TIME_BOUNDS))
+    return histograms
+
+class _RequestCollector:
+    """
+    Exports the per-request metrics MetricsMiddleware keeps in plain counters.
+    """
+    def collect(self):
+        latency = HistogramMetricFamily("http_request_duration_seconds", "HTTP request latency by route", labels=["method", "route", "status"])
+        for (method, route, status), histogram in list(_latency.items()):
+            latency.add_metric([method, route, str(status)], list(histogram.buckets()), histogram.sum)
+        queries = HistogramMetricFamily("db_queries_per_request", "SQL statements executed per HTTP request", labels=["route"])
+        db_time = HistogramMetricFamily("db_time_per_request_seconds", "Total SQL time per HTTP request", labels=["route"])
+        for route, (query_histogram, time_histogram) in list(_db_usage.items()):
+            queries.add_metric([route], list(query_histogram.buckets()), query_histogram.sum)
+            db_time.add_metric([route], list(time_histogram.buckets()), time_histogram.sum)
+        in_progress = GaugeMetricFamily("http_requests_in_progress", "HTTP requests currently being served", labels=["method"])
+        for method, count in list(_in_progress.items()):
+            in_progress.add_metric([method], count)
+        yield latency
+        yield queries
+        yield db_time
+        yield in_progress
+
+REGISTRY.register(_RequestCollector())
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, in-flight count and SQL usage per route.
+    A sampled fraction of requests runs under cProfile; profiles of slow ones are logged.
+    cProfile follows the thread, not the request: while a sampled request is awaited, every other
+    coroutine the event loop runs is profiled too, so a logged profile mixes in the concurrent
+    requests and background tasks. Treat it as a picture of the worker during a slow request,
+    most useful under low concurrency.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        global _profiling
+        method = scope["method"]
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        _in_progress[method] = _in_progress.get(method, 0) + 1
+        totals = [0, 0.0]
+        token = _request_db.set(totals)
+        profiler = None
+        if _should_profile():
+            _profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                _profiling = False
+            _request_db.reset(token)
+            _in_progress[method] -= 1
+            # Label by route template (set by FastAPI routing) to keep cardinality bounded
+            matched = scope.get("route")
+            route = matched.path if matched is not None else "unmatched"
+            _latency_histogram(method, route, status[0]).observe(elapsed)
+            queries, db_time = _db_histograms(route)
+            queries.observe(totals[0])
+            db_time.observe(totals[1])
+            if profiler is not None and elapsed * 1000 >= settings.PROFILE_SLOW_REQUEST_MS:
+                _report_profile(profiler, method, route, elapsed)
@@ -1,40 +1,92 @@
-"""
-Custom middleware for CORS and rate limiting based on user subscription tier.
-"""
-from fastapi import Request, Response
-from fastapi.responses import JSONResponse
-from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from .utils import get_daily_usage, increment_daily_usage
-from .models import Subscription
-from .config import settings
-from sqlalchemy.orm import Session
-from .database import SessionLocal
-from jose import jwt
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """
-    Middleware to enforce daily message limits for basic users on chatroom message endpoints.
-    """
-    async def dispatch(self, request: Request, call_next):
-        """
-        Intercept chatroom message requests and enforce rate limits for basic users.
-        """
-        if request.url.path.startswith("/chatroom") and request.method == "POST" and "/message" in request.url.path:
-            token = request.headers.get("Authorization", "").replace("Bearer ", "")
-            if token:
-                try:
-                    payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-                    user_id = int(payload["sub"])
-                except Exception:
-                    return JSONResponse(status_code=401, content={"status": "error", "message": "Invalid token"})
-                db: Session = SessionLocal()
-                sub = db.query(Subscription).filter(Subscription.user_id == user_id).first()
-                if not sub or sub.tier == "basic":
-                    count = get_daily_usage(user_id)
-                    if count >= settings.BASIC_DAILY_LIMIT:
-                        return JSONResponse(status_code=429, content={"status": "error", "message": "Daily message limit reached for Basic tier."})
-                    increment_daily_usage(user_id)
-                db.close()
-        response = await call_next(request)
-        return response 
\ No newline at end of file
+"""
+Custom middleware for rate limiting based on user subscription tier.
+"""
+import re
+from fastapi.responses import JSONResponse
+from .ratelimit import check_rate_limit
+from .tiers import get_user_tier
+from .config import settings
+from .metrics import RATE_LIMIT_REJECTIONS
+from jose import jwt
+
+# (method, path pattern) of every rate-limited route, compiled once at import.
+# POST /chatroom/{id}/messages:batch is not listed: it charges one unit per prompt itself.
+RATE_LIMITED_ROUTES = (
+    ("POST", re.compile(r"^/chatroom/\d+/message/?$")),
+    ("POST", re.compile(r"^/chatroom/\d+/message/(?:stream|async)/?$")),
+)
+
+def _is_rate_limited(method: str, path: str) -> bool:
+    """
+    Return True if the request matches a rate-limited route.
+    """
+    for route_method, pattern in RATE_LIMITED_ROUTES:
+        if method == route_method and pattern.match(path):
+            return True
+    return False
+
+def _bearer_token(scope) -> str:
+    """
+    Extract the bearer token from the raw ASGI Authorization header, or '' if absent.
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            return value.decode("latin-1").replace("Bearer ", "")
+    return ""
+
+def rate_limit_rejection(tier: str, result) -> JSONResponse:
+    """
+    Count a rejected request and build its 429 response with the rate-limit headers.
+    """
+    RATE_LIMIT_REJECTIONS.labels(tier, result.rule).inc()
+    if result.rule == "daily":
+        message = f"Daily message limit reached for {tier.capitalize()} tier."
+    else:
+        message = f"Too many messages for {tier.capitalize()} tier, retry later."
+    return JSONResponse(status_code=429, content={"status": "error", "message": message}, headers=result.headers())
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware to enforce per-tier message rate limits on chatroom message endpoints.
+    Requests to other routes are passed straight through without any wrapping.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """
+        Intercept chatroom message requests and enforce the rate limits of the user's tier.
+        Adds X-RateLimit-* headers, and Retry-After on 429 responses.
+        """
+        if scope["type"] != "http" or not _is_rate_limited(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        token = _bearer_token(scope)
+        if not token:
+            await self.app(scope, receive, send)
+            return
+        try:
+            payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+            user_id = int(payload["sub"])
+        except Exception:
+            response = JSONResponse(status_code=401, content={"status": "error", "message": "Invalid token"})
+            await response(scope, receive, send)
+            return
+        tier = await get_user_tier(user_id)
+        # Single atomic check-and-charge across all of the tier's rules
+        result = await check_rate_limit(user_id, tier)
+        if result is None:
+            await self.app(scope, receive, send)
+            return
+        if not result.allowed:
+            response = rate_limit_rejection(tier, result)
+            await response(scope, receive, send)
+            return
+        extra_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in result.headers().items()]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + extra_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -1,67 +1,153 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
-from sqlalchemy.orm import relationship
-from datetime import datetime
-from .database import Base
-
-class User(Base):
-    """
-    SQLAlchemy model for application users.
-    Each user is identified by a unique mobile number and may have associated chatrooms and a subscription.
-    """
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    mobile = Column(String, unique=True, index=True, nullable=False)
-    password_hash = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    is_active = Column(Boolean, default=True)
-    chatrooms = relationship("Chatroom", back_populates="owner")
-    subscription = relationship("Subscription", uselist=False, back_populates="user")
-
-class OTP(Base):
-    """
-    Stores OTP codes for authentication and password reset purposes.
-    """
-    __tablename__ = "otps"
-    id = Column(Integer, primary_key=True, index=True)
-    mobile = Column(String, index=True, nullable=False)
-    otp_code = Column(String, nullable=False)
-    expires_at = Column(DateTime, nullable=False)
-    purpose = Column(String, nullable=False)  # 'login' or 'reset'
-
-class Chatroom(Base):
-    """
-    Represents a chatroom owned by a user, containing multiple messages.
-    """
-    __tablename__ = "chatrooms"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
-    owner_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.utcnow)
-    owner = relationship("User", back_populates="chatrooms")
-    messages = relationship("Message", back_populates="chatroom")
-
-class Message(Base):
-    """
-    Stores individual messages in a chatroom, sent by either the user or Gemini.
-    """
-    __tablename__ = "messages"
-    id = Column(Integer, primary_key=True, index=True)
-    chatroom_id = Column(Integer, ForeignKey("chatrooms.id"))
-    sender = Column(String, nullable=False)  # 'user' or 'gemini'
-    content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    chatroom = relationship("Chatroom", back_populates="messages")
-
-class Subscription(Base):
-    """
-    Stores subscription details for a user, including tier and Stripe integration.
-    """
-    __tablename__ = "subscriptions"
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), unique=True)
-    tier = Column(String, default="basic")  # 'basic' or 'pro'
-    stripe_subscription_id = Column(String, nullable=True)
-    status = Column(String, default="inactive")
-    started_at = Column(DateTime, nullable=True)
-    ends_at = Column(DateTime, nullable=True)
-    user = relationship("User", back_populates="subscription") 
\ No newline at end of file
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index, event, inspect, literal_column, text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from .database import Base
+
+class User(Base):
+    """
+    SQLAlchemy model for application users.
+    Each user is identified by a unique mobile number and may have associated chatrooms and a subscription.
+    """
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    mobile = Column(String, unique=True, index=True, nullable=False)
+    password_hash = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    is_active = Column(Boolean, default=True)
+    chatrooms = relationship("Chatroom", back_populates="owner")
+    subscription = relationship("Subscription", uselist=False, back_populates="user")
+
+class OTP(Base):
+    """
+    Stores OTP codes for authentication and password reset purposes (Postgres OTP backend).
+    """
+    __tablename__ = "otps"
+    __table_args__ = (
+        # Lookup used by OTP verification
+        Index("ix_otps_mobile_purpose_otp_code", "mobile", "purpose", "otp_code"),
+        # Range scan used by the expired-row purge
+        Index("ix_otps_expires_at", "expires_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    mobile = Column(String, index=True, nullable=False)
+    otp_code = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    purpose = Column(String, nullable=False)  # 'login' or 'reset'
+
+# create_all only creates indexes along with their table, so existing otps tables need these explicitly
+OTP_INDEX_DDL = (
+    "CREATE INDEX IF NOT EXISTS ix_otps_mobile_purpose_otp_code ON otps (mobile, purpose, otp_code)",
+    "CREATE INDEX IF NOT EXISTS ix_otps_expires_at ON otps (expires_at)",
+)
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_otp_indexes(target, connection, **kw):
+    """
+    Add the OTP lookup and purge indexes after every create_all, so existing databases pick them up too.
+    """
+    for statement in OTP_INDEX_DDL:
+        connection.execute(text(statement))
+
+class Chatroom(Base):
+    """
+    Represents a chatroom owned by a user, containing multiple messages.
+    """
+    __tablename__ = "chatrooms"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    owner = relationship("User", back_populates="chatrooms")
+    messages = relationship("Message", back_populates="chatroom")
+    summary = relationship("ChatroomSummary", uselist=False, back_populates="chatroom")
+
+class Message(Base):
+    """
+    Stores individual messages in a chatroom, sent by either the user or Gemini.
+    """
+    __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset pagination over a chatroom's messages
+        Index("ix_messages_chatroom_id_id", "chatroom_id", "id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    chatroom_id = Column(Integer, ForeignKey("chatrooms.id"))
+    sender = Column(String, nullable=False)  # 'user' or 'gemini'
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    chatroom = relationship("Chatroom", back_populates="messages")
+
+class ChatroomSummary(Base):
+    """
+    Rolling summary of a chatroom's older messages, used in place of them when building Gemini prompts.
+    Covers every message up to and including through_message_id.
+    """
+    __tablename__ = "chatroom_summaries"
+    chatroom_id = Column(Integer, ForeignKey("chatrooms.id"), primary_key=True)
+    summary = Column(Text, nullable=False)
+    through_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    chatroom = relationship("Chatroom", back_populates="summary")
+
+# Full-text search over message content (PostgreSQL only): a generated tsvector column with a GIN index.
+# They are not mapped columns, so create_all still works on other databases; queries use MESSAGE_SEARCH_VECTOR.
+MESSAGE_SEARCH_CONFIG = "english"
+MESSAGE_SEARCH_VECTOR = literal_column("messages.search_vector")
+MESSAGE_SEARCH_DDL = (
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{MESSAGE_SEARCH_CONFIG}', content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+)
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_message_search_index(target, connection, **kw):
+    """
+    Add the search column and index after every create_all, so existing databases pick them up too.
+    """
+    if connection.dialect.name == "postgresql":
+        for statement in MESSAGE_SEARCH_DDL:
+            connection.execute(text(statement))
+
+class Subscription(Base):
+    """
+    Stores subscription details for a user, including tier and Stripe integration.
+    """
+    __tablename__ = "subscriptions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True)
+    tier = Column(String, default="basic")  # 'basic' or 'pro'
+    stripe_subscription_id = Column(String, nullable=True)
+    status = Column(String, default="inactive")
+    started_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+    last_event_at = Column(DateTime, nullable=True)  # creation time of the last applied Stripe event
+    user = relationship("User", back_populates="subscription")
+
+@event.listens_for(Base.metadata, "after_create")
+def _add_subscription_last_event_at(target, connection, **kw):
+    """
+    Add subscriptions.last_event_at to databases created before it existed; create_all only adds missing tables.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS last_event_at TIMESTAMP"))
+    # SQLite has no ADD COLUMN IF NOT EXISTS
+    elif "last_event_at" not in {column["name"] for column in inspect(connection).get_columns("subscriptions")}:
+        connection.execute(text("ALTER TABLE subscriptions ADD COLUMN last_event_at TIMESTAMP"))
+
+class StripeEvent(Base):
+    """
+    Stripe webhook events as received, deduplicated by Stripe event id and applied by a background task.
+    """
+    __tablename__ = "stripe_events"
+    __table_args__ = (
+        # Pending events of a user, in Stripe creation order
+        Index("ix_stripe_events_user_id_processed_at_created", "user_id", "processed_at", "created"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, nullable=False)
+    type = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    payload = Column(Text, nullable=False)
+    created = Column(DateTime, nullable=False)  # Stripe's event timestamp
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,132 @@
+"""
+OTP storage backends: Redis (native TTL, atomic one-shot verification, attempt limits)
+and Postgres (the otps table), plus a batched purge task for expired rows.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, utils
+from .redis_pool import async_script, get_async_redis
+from .celery_worker import celery_app
+from .config import settings
+from .database import SessionLocal
+
+# KEYS[1]: OTP key, KEYS[2]: the mobile's failed-attempts key; ARGV[1]: submitted code,
+# ARGV[2]: max attempts, ARGV[3]: attempts TTL (s).
+# A matching code is deleted in the same step it is read (GETDEL semantics). Failed attempts are
+# counted per mobile across issued codes and expire on their own TTL; while the count is at the
+# limit every verification is refused and the current code is discarded.
+_VERIFY_OTP_LUA = """
+local attempts = tonumber(redis.call('GET', KEYS[2]) or '0')
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return 0
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+attempts = redis.call('INCR', KEYS[2])
+if attempts == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class OTPStore:
+    """
+    Interface for issuing and verifying one-time passwords.
+    """
+    async def issue(self, db: AsyncSession, mobile: str, purpose: str) -> str:
+        """
+        Generate and store a new OTP for the mobile and purpose, returning the code.
+        """
+        raise NotImplementedError
+
+    async def verify(self, db: AsyncSession, mobile: str, otp_code: str, purpose: str) -> bool:
+        """
+        Check an OTP and consume it if valid. Returns True on success.
+        """
+        raise NotImplementedError
+
+class RedisOTPStore(OTPStore):
+    """
+    Stores each OTP under a Redis key that expires on its own; nothing accumulates.
+    Verification is a single atomic script that consumes the code and counts failed attempts per mobile.
+    Issuing a new code does not reset the count, so after OTP_MAX_ATTEMPTS wrong guesses the mobile
+    cannot verify any code until the count expires (OTP_LOCKOUT_MINUTES after the first failure).
+    """
+    @staticmethod
+    def _keys(mobile: str, purpose: str):
+        return [f"otp:{purpose}:{mobile}", f"otp:attempts:{mobile}"]
+
+    async def issue(self, db: AsyncSession, mobile: str, purpose: str) -> str:
+        otp_code = utils.generate_otp()
+        await get_async_redis().set(self._keys(mobile, purpose)[0], otp_code, ex=settings.OTP_EXPIRE_MINUTES * 60)
+        return otp_code
+
+    async def verify(self, db: AsyncSession, mobile: str, otp_code: str, purpose: str) -> bool:
+        result = await async_script(_VERIFY_OTP_LUA)(
+            keys=self._keys(mobile, purpose),
+            args=[otp_code, settings.OTP_MAX_ATTEMPTS, settings.OTP_LOCKOUT_MINUTES * 60],
+        )
+        return result == 1
+
+class PostgresOTPStore(OTPStore):
+    """
+    Stores OTPs as rows in the otps table. Expired rows are removed by purge_expired_otps.
+    """
+    async def issue(self, db: AsyncSession, mobile: str, purpose: str) -> str:
+        otp_code = utils.generate_otp()
+        expires_at = datetime.now() + timedelta(minutes=settings.OTP_EXPIRE_MINUTES)
+        db.add(models.OTP(mobile=mobile, otp_code=otp_code, expires_at=expires_at, purpose=purpose))
+        await db.commit()
+        return otp_code
+
+    async def verify(self, db: AsyncSession, mobile: str, otp_code: str, purpose: str) -> bool:
+        db_otp = await db.scalar(select(models.OTP).filter(models.OTP.mobile == mobile, models.OTP.purpose == purpose, models.OTP.otp_code == otp_code))
+        if not db_otp or db_otp.expires_at < datetime.now():
+            return False
+        # Remove used OTP
+        await db.delete(db_otp)
+        await db.commit()
+        return True
+
+_BACKENDS = {"redis": RedisOTPStore, "postgres": PostgresOTPStore}
+_store = None
+
+def get_otp_store() -> OTPStore:
+    """
+    Return the OTP store selected by settings.OTP_BACKEND ('redis' or 'postgres').
+    """
+    global _store
+    if _store is None:
+        _store = _BACKENDS[settings.OTP_BACKEND]()
+    return _store
+
+@celery_app.task
+def purge_expired_otps(batch_size: int = None):
+    """
+    Celery task to delete expired rows from the otps table in small batches.
+    Returns the number of rows deleted.
+    """
+    batch_size = batch_size or settings.OTP_PURGE_BATCH_SIZE
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            expired_ids = select(models.OTP.id).filter(models.OTP.expires_at < datetime.now()).limit(batch_size).scalar_subquery()
+            result = db.execute(delete(models.OTP).where(models.OTP.id.in_(expired_ids)))
+            db.commit()
+            total += result.rowcount
+            if result.rowcount < batch_size:
+                return total
+    finally:
+        db.close()
@@ -0,0 +1,201 @@
+"""
+Atomic Redis rate limiting with fixed-window, sliding-window and token-bucket rules configured per tier.
+All rules for a request are checked and charged in a single Lua script round trip.
+"""
+import math
+import time
+import uuid
+from dataclasses import dataclass
+from .redis_pool import async_script
+from .config import settings
+
+FIXED_WINDOW = "fixed"
+SLIDING_WINDOW = "sliding"
+TOKEN_BUCKET = "bucket"
+
+# KEYS[i]: state key for rule i.
+# ARGV[1]: now (ms), ARGV[2]: cost, ARGV[3]: unique request id,
+# then (algorithm, limit, window ms) for each rule.
+# Every rule is evaluated first; state is only charged if all of them allow the request.
+# Returns {allowed, rule index, remaining, reset ms, retry-after ms} for the most restrictive rule.
+_RATE_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local request_id = ARGV[3]
+local allowed = 1
+local results = {}
+for i = 1, #KEYS do
+    local base = 4 + (i - 1) * 3
+    local algo = ARGV[base]
+    local limit = tonumber(ARGV[base + 1])
+    local window = tonumber(ARGV[base + 2])
+    local key = KEYS[i]
+    local ok, remaining, reset, retry, state
+    if algo == 'fixed' then
+        local count = tonumber(redis.call('GET', key) or '0')
+        ok = count + cost <= limit
+        remaining = limit - count
+        reset = window - (now % window)
+        retry = reset
+        state = count
+    elseif algo == 'sliding' then
+        redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+        local count = redis.call('ZCARD', key)
+        ok = count + cost <= limit
+        remaining = limit - count
+        reset = window
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        if oldest[2] then
+            reset = tonumber(oldest[2]) + window - now
+        end
+        retry = 0
+        if not ok then
+            -- Wait until enough of the oldest entries slide out of the window
+            local idx = count + cost - limit - 1
+            if idx >= count then
+                retry = window
+            else
+                local entry = redis.call('ZRANGE', key, idx, idx, 'WITHSCORES')
+                retry = tonumber(entry[2]) + window - now
+            end
+        end
+    else
+        local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or limit
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(limit, tokens + math.max(0, now - ts) * limit / window)
+        ok = tokens >= cost
+        remaining = math.floor(tokens)
+        reset = math.ceil((limit - tokens) * window / limit)
+        retry = 0
+        if not ok then
+            retry = math.ceil((cost - tokens) * window / limit)
+        end
+        state = tokens
+    end
+    if not ok then
+        allowed = 0
+    end
+    results[i] = {ok, remaining, reset, retry, state, algo, window}
+end
+
+local best = 1
+for i = 1, #KEYS do
+    local r = results[i]
+    if allowed == 1 then
+        -- Report the rule closest to its limit
+        r[2] = r[2] - cost
+        if r[2] < results[best][2] then best = i end
+    elseif not r[1] and (results[best][1] or r[4] > results[best][4]) then
+        -- Report the denying rule that frees up last
+        best = i
+    end
+end
+
+if allowed == 1 then
+    for i = 1, #KEYS do
+        local r = results[i]
+        local key = KEYS[i]
+        if r[6] == 'fixed' then
+            redis.call('INCRBY', key, cost)
+            if r[5] == 0 then
+                redis.call('PEXPIRE', key, r[3])
+            end
+        elseif r[6] == 'sliding' then
+            for j = 1, cost do
+                redis.call('ZADD', key, now, request_id .. ':' .. j)
+            end
+            redis.call('PEXPIRE', key, r[7])
+        else
+            redis.call('HSET', key, 'tokens', r[5] - cost, 'ts', now)
+            redis.call('PEXPIRE', key, r[7])
+        end
+    end
+end
+
+local r = results[best]
+return {allowed, best, r[2], r[3], r[4]}
+"""
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """
+    A single limit: at most `limit` requests per `window_seconds` (fixed or sliding window),
+    or a bucket of `limit` tokens that fully refills over `window_seconds` (token bucket).
+    """
+    name: str
+    algorithm: str
+    limit: int
+    window_seconds: float
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    """
+    Outcome of a rate-limit check, reported for the most restrictive rule.
+    """
+    allowed: bool
+    rule: str
+    limit: int
+    remaining: int
+    reset_seconds: int
+    retry_after_seconds: int
+
+    def headers(self) -> dict:
+        """
+        Standard rate-limit response headers for this result.
+        """
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset_seconds),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after_seconds)
+        return headers
+
+def _tier_rules(daily: int, per_minute: int, burst: int, burst_refill_seconds: float):
+    """
+    Build the rule list for a tier, skipping limits configured as 0 (disabled).
+    """
+    rules = [
+        RateLimitRule("daily", FIXED_WINDOW, daily, 86400),
+        RateLimitRule("minute", SLIDING_WINDOW, per_minute, 60),
+        RateLimitRule("burst", TOKEN_BUCKET, burst, burst_refill_seconds),
+    ]
+    return [rule for rule in rules if rule.limit > 0]
+
+# Tiers without rules (or not listed) are unlimited
+TIER_RULES = {
+    "basic": _tier_rules(settings.BASIC_DAILY_LIMIT, settings.BASIC_PER_MINUTE_LIMIT, settings.BASIC_BURST_CAPACITY, settings.BASIC_BURST_REFILL_SECONDS),
+    "pro": _tier_rules(settings.PRO_DAILY_LIMIT, settings.PRO_PER_MINUTE_LIMIT, settings.PRO_BURST_CAPACITY, settings.PRO_BURST_REFILL_SECONDS),
+}
+
+async def check_rate_limit(user_id: int, tier: str, cost: int = 1):
+    """
+    Atomically check and charge `cost` requests against every rule for the user's tier.
+    Returns a RateLimitResult, or None if the tier is unlimited.
+    """
+    rules = TIER_RULES.get(tier)
+    if not rules:
+        return None
+    now_ms = int(time.time() * 1000)
+    keys = []
+    args = [now_ms, cost, uuid.uuid4().hex]
+    for rule in rules:
+        window_ms = int(rule.window_seconds * 1000)
+        key = f"ratelimit:{user_id}:{rule.name}"
+        if rule.algorithm == FIXED_WINDOW:
+            # Windows are aligned to the epoch, so the daily quota resets at UTC midnight
+            key = f"{key}:{now_ms // window_ms}"
+        keys.append(key)
+        args += [rule.algorithm, rule.limit, window_ms]
+    allowed, index, remaining, reset_ms, retry_ms = await async_script(_RATE_LIMIT_LUA)(keys=keys, args=args)
+    rule = rules[index - 1]
+    return RateLimitResult(
+        allowed=bool(allowed),
+        rule=rule.name,
+        limit=rule.limit,
+        remaining=max(0, remaining),
+        reset_seconds=math.ceil(reset_ms / 1000),
+        retry_after_seconds=math.ceil(retry_ms / 1000),
+    )
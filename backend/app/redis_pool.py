@@ -0,0 +1,166 @@
+"""
+Shared Redis connections: one pooled sync client per process and one pooled asyncio client per
+event loop, configured from settings, plus helpers to pipeline several commands in one round trip.
+"""
+import asyncio
+import time
+import redis
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff, NoBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+from .config import settings
+from .metrics import observe_redis
+
+def _pool_options() -> dict:
+    """
+    Connection pool options shared by the sync and asyncio pools.
+    """
+    return {
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        # Wait this long for a free connection before failing
+        "timeout": settings.REDIS_POOL_TIMEOUT_SECONDS,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+        "socket_keepalive": True,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        # Reconnect and retry commands that fail on a dropped or timed-out connection
+        "retry_on_error": [ConnectionError, TimeoutError],
+    }
+
+def _backoff() -> ExponentialBackoff:
+    return ExponentialBackoff(cap=settings.REDIS_RETRY_BACKOFF_CAP_SECONDS, base=settings.REDIS_RETRY_BACKOFF_BASE_SECONDS)
+
+class _TimedRedis(redis.Redis):
+    # Pipelines bypass execute_command; pipeline() times them as one round trip
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            observe_redis(str(args[0]), time.perf_counter() - started)
+
+class _TimedAsyncRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_redis(str(args[0]), time.perf_counter() - started)
+
+_sync_client = None
+
+def get_redis() -> redis.Redis:
+    """
+    Return the process-wide sync Redis client, creating it on first use. Creating it does not connect.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = _TimedRedis(connection_pool=redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, retry=Retry(_backoff(), settings.REDIS_RETRIES), **_pool_options()
+        ))
+    return _sync_client
+
+# One asyncio client per event loop: asyncio connections cannot be shared across loops.
+_async_clients = {}
+_async_scripts = {}
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    Return the shared asyncio Redis client for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, retry=AsyncRetry(_backoff(), settings.REDIS_RETRIES), **_pool_options()
+        )
+        client = _async_clients[loop] = _TimedAsyncRedis(connection_pool=pool)
+    return client
+
+async def warm_up_async_redis():
+    """
+    Open the first pooled connection of the running loop's client. A single probe without the
+    retry policy goes first, so a Redis that is down fails in one connect attempt, not after every
+    retry and backoff.
+    """
+    probe = aioredis.Redis.from_url(
+        settings.REDIS_URL, retry=AsyncRetry(NoBackoff(), 0), socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS
+    )
+    try:
+        await probe.ping()
+    finally:
+        await probe.aclose()
+    await get_async_redis().ping()
+
+def async_script(source: str):
+    """
+    Return the Lua script registered on the running loop's client, registering it once per loop.
+    """
+    scripts = _async_scripts.setdefault(asyncio.get_running_loop(), {})
+    script = scripts.get(source)
+    if script is None:
+        script = scripts[source] = get_async_redis().register_script(source)
+    return script
+
+async def close_async_redis():
+    """
+    Close the asyncio client bound to the running event loop, if any.
+    """
+    loop = asyncio.get_running_loop()
+    _async_scripts.pop(loop, None)
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.connection_pool.disconnect()
+
+def _queue(pipe, commands):
+    # Each command is (name, *args); a trailing dict is passed as keyword arguments
+    for name, *args in commands:
+        kwargs = args.pop() if args and isinstance(args[-1], dict) else {}
+        getattr(pipe, name)(*args, **kwargs)
+
+def pipeline(*commands, transaction: bool = False) -> list:
+    """
+    Run several commands on the sync client in one round trip and return their replies in order,
+    e.g. pipeline(("delete", key), ("publish", channel, message)).
+    With transaction=True they are wrapped in MULTI/EXEC.
+    """
+    pipe = get_redis().pipeline(transaction=transaction)
+    _queue(pipe, commands)
+    started = time.perf_counter()
+    try:
+        return pipe.execute()
+    finally:
+        observe_redis("PIPELINE", time.perf_counter() - started)
+
+async def apipeline(*commands, transaction: bool = False) -> list:
+    """
+    Same as pipeline, on the running loop's asyncio client.
+    """
+    async with get_async_redis().pipeline(transaction=transaction) as pipe:
+        _queue(pipe, commands)
+        started = time.perf_counter()
+        try:
+            return await pipe.execute()
+        finally:
+            observe_redis("PIPELINE", time.perf_counter() - started)
+
+def _sync_pool_stats(pool) -> dict:
+    # BlockingConnectionPool keeps created connections in _connections and idle ones in a queue
+    idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {"max_connections": pool.max_connections, "created": len(pool._connections), "in_use": len(pool._connections) - idle, "idle": idle}
+
+def _async_pool_stats(pool) -> dict:
+    in_use = len(pool._in_use_connections)
+    idle = len(pool._available_connections)
+    return {"max_connections": pool.max_connections, "created": in_use + idle, "in_use": in_use, "idle": idle}
+
+def pool_stats() -> dict:
+    """
+    Return connection counts for the sync pool and each event loop's asyncio pool.
+    """
+    return {
+        "sync": _sync_pool_stats(_sync_client.connection_pool) if _sync_client is not None else None,
+        "async": [_async_pool_stats(client.connection_pool) for client in list(_async_clients.values())],
+    }
@@ -1,100 +1,391 @@
-"""
-Handles chatroom creation, listing, retrieval, and messaging, including Gemini AI integration and caching.
-"""
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from .. import models, schemas, deps, cache, gemini
-from ..config import settings
-from ..database import SessionLocal
-from ..cache import get_chatrooms_cache, set_chatrooms_cache, clear_chatrooms_cache
-from typing import List
-from ..gemini import call_gemini_api
-from datetime import datetime
-
-router = APIRouter(prefix="/chatroom", tags=["chatroom"])
-
-@router.post("/", response_model=schemas.ChatroomOut)
-async def create_chatroom(chatroom: schemas.ChatroomCreate, db: Session = Depends(deps.get_db)):
-    """
-    Create a new chatroom for the current user.
-    """
-    # Get current user from schema
-    current_user = await deps.get_current_user_from_schema(chatroom, db)
-    new_chatroom = models.Chatroom(name=chatroom.name, owner_id=current_user.id)
-    db.add(new_chatroom)
-    db.commit()
-    db.refresh(new_chatroom)
-    # Clear cache to ensure new chatroom appears in list
-    clear_chatrooms_cache(current_user.id)
-    return new_chatroom
-
-@router.get("/", response_model=List[schemas.ChatroomOut])
-async def list_chatrooms(access_token: str = Query(...), db: Session = Depends(deps.get_db)):
-    """
-    List all chatrooms for the current user, using cache if available.
-    """
-    # Get current user from access token
-    current_user = await deps.get_current_user_from_query(access_token, db)
-    cached = get_chatrooms_cache(current_user.id)
-    if cached:
-        # Ensure only dicts are returned from cache
-        if all(isinstance(c, dict) for c in cached):
-            return [schemas.ChatroomOut(**c) for c in cached]
-        else:
-            # Bad cache data, clear and fall back to DB
-            print("[list_chatrooms] Bad cache data detected, clearing cache.")
-            clear_chatrooms_cache(current_user.id)
-    chatrooms = db.query(models.Chatroom).filter(models.Chatroom.owner_id == current_user.id).all()
-    # Convert SQLAlchemy objects to dicts for Pydantic
-    def chatroom_to_dict(obj):
-        d = {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
-        if isinstance(d.get("created_at"), datetime):
-            d["created_at"] = d["created_at"].isoformat()
-        return d
-    result = [schemas.ChatroomOut(**chatroom_to_dict(c)) for c in chatrooms]
-    # Cache as list of dicts with all datetimes as ISO strings
-    cache_data = []
-    for r in result:
-        d = r.model_dump()
-        # Convert all datetime fields to ISO strings
-        for k, v in d.items():
-            if isinstance(v, datetime):
-                d[k] = v.isoformat()
-        cache_data.append(d)
-    set_chatrooms_cache(current_user.id, cache_data)
-    return result
-
-@router.get("/{id}", response_model=schemas.ChatroomOut)
-async def get_chatroom(id: int, access_token: str = Query(...), db: Session = Depends(deps.get_db)):
-    """
-    Retrieve a specific chatroom by ID for the current user.
-    """
-    # Get current user from access token
-    current_user = await deps.get_current_user_from_query(access_token, db)
-    chatroom = db.query(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id).first()
-    if not chatroom:
-        raise HTTPException(status_code=404, detail="Chatroom not found")
-    return chatroom
-
-@router.post("/{id}/message", response_model=schemas.MessageOut)
-async def send_message(id: int, msg: schemas.MessageCreate, db: Session = Depends(deps.get_db)):
-    """
-    Send a message to a chatroom and get a Gemini AI response.
-    """
-    # Get current user from schema
-    current_user = await deps.get_current_user_from_schema(msg, db)
-    chatroom = db.query(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id).first()
-    if not chatroom:
-        raise HTTPException(status_code=404, detail="Chatroom not found")
-    # Save user message
-    user_msg = models.Message(chatroom_id=id, sender="user", content=msg.content)
-    db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
-    # Call Gemini API synchronously
-    gemini_response = call_gemini_api(msg.content)
-    ai_msg = models.Message(chatroom_id=id, sender="gemini", content=gemini_response)
-    db.add(ai_msg)
-    db.commit()
-    db.refresh(ai_msg)
-    return ai_msg 
\ No newline at end of file
+"""
+Handles chatroom creation, listing, retrieval, and messaging, including Gemini AI integration and caching.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from celery.result import AsyncResult
+from sqlalchemy import select, func, or_, and_, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, schemas, deps, cache, gemini
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..cache import append_chatroom_cache, get_or_load_chatrooms
+from typing import List, Optional
+from ..gemini import acall_gemini_api, astream_gemini_api, gemini_message_task
+from ..gemini_client import GeminiError
+from ..celery_worker import celery_app
+from ..history import build_history, record_message, record_messages
+from ..message_writer import save_message, save_messages
+from ..middleware import rate_limit_rejection
+from ..ratelimit import check_rate_limit
+from ..tiers import get_user_tier
+import asyncio
+import json
+import math
+import orjson
+import time
+
+router = APIRouter(prefix="/chatroom", tags=["chatroom"])
+
+@router.post("/", response_model=schemas.ChatroomOut)
+async def create_chatroom(chatroom: schemas.ChatroomCreate, db: AsyncSession = Depends(deps.get_db)):
+    """
+    Create a new chatroom for the current user.
+    """
+    # Get current user from schema
+    current_user = await deps.get_current_user_from_schema(chatroom, db)
+    new_chatroom = models.Chatroom(name=chatroom.name, owner_id=current_user.id)
+    db.add(new_chatroom)
+    await db.commit()
+    await db.refresh(new_chatroom)
+    # Append to the cached list so the next listing does not go back to the database
+    await append_chatroom_cache(current_user.id, _chatroom_to_dict(new_chatroom))
+    return new_chatroom
+
+def _chatroom_to_dict(obj):
+    """
+    Convert a Chatroom into the dict shape cached for chatroom listings.
+    """
+    return {"id": obj.id, "name": obj.name, "created_at": obj.created_at}
+
+def _json_response(content: bytes) -> Response:
+    """
+    Return pre-encoded JSON bytes as-is, skipping response_model validation and re-encoding.
+    """
+    return Response(content=content, media_type="application/json")
+
+async def _load_chatrooms(user_id: int):
+    """
+    Load a user's chatrooms from the database for the list cache, selecting only the listed columns.
+    Uses its own session since the load may outlive the request that started it.
+    """
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(models.Chatroom.id, models.Chatroom.name, models.Chatroom.created_at)
+            .filter(models.Chatroom.owner_id == user_id)
+            .order_by(models.Chatroom.id)
+        )
+        return [dict(row) for row in rows.mappings()]
+
+@router.get("/", response_model=List[schemas.ChatroomOut])
+async def list_chatrooms(access_token: str = Query(...), db: AsyncSession = Depends(deps.get_db)):
+    """
+    List all chatrooms for the current user, using cache if available.
+    The cached JSON bytes are returned directly; response_model only documents the shape.
+    """
+    # Get current user from access token
+    current_user = await deps.get_current_user_from_query(access_token, db)
+    data = await get_or_load_chatrooms(current_user.id, lambda: _load_chatrooms(current_user.id))
+    return _json_response(data)
+
+def _parse_search_cursor(cursor: str):
+    """
+    Split a search cursor into (rank, message id), or raise HTTP 400.
+    """
+    try:
+        rank, message_id = cursor.split(":")
+        return float(rank), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Declared before /{id} so "search" is not parsed as a chatroom id
+@router.get("/search", response_model=schemas.MessageSearchPage)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256, description="Search terms (web search syntax: quotes, OR, -word)"),
+    access_token: str = Query(...),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(settings.SEARCH_PAGE_SIZE, ge=1, le=settings.SEARCH_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(deps.get_db),
+):
+    """
+    Full-text search across all messages in the current user's chatrooms, best match first.
+    Matches come from the GIN-indexed tsvector column; only the newest SEARCH_MAX_CANDIDATES
+    matches are ranked, which keeps the cost per query bounded as the table grows.
+    """
+    # Get current user from access token
+    current_user = await deps.get_current_user_from_query(access_token, db)
+    if db.bind.dialect.name != "postgresql":
+        raise HTTPException(status_code=501, detail="Search requires PostgreSQL")
+    tsquery = func.websearch_to_tsquery(models.MESSAGE_SEARCH_CONFIG, q)
+    candidates = (
+        select(
+            models.Message.id,
+            models.Message.chatroom_id,
+            models.Message.sender,
+            models.Message.content,
+            models.Message.created_at,
+            func.ts_rank_cd(models.MESSAGE_SEARCH_VECTOR, tsquery).label("rank"),
+        )
+        .join(models.Chatroom, models.Chatroom.id == models.Message.chatroom_id)
+        .filter(models.Chatroom.owner_id == current_user.id, models.MESSAGE_SEARCH_VECTOR.op("@@")(tsquery))
+        .order_by(models.Message.id.desc())
+        .limit(settings.SEARCH_MAX_CANDIDATES)
+        .cte("candidates")
+    )
+    # Keyset pagination on (rank, id), both descending
+    page = select(candidates)
+    if cursor is not None:
+        rank, message_id = _parse_search_cursor(cursor)
+        page = page.filter(or_(candidates.c.rank < rank, and_(candidates.c.rank == rank, candidates.c.id < message_id)))
+    page = page.order_by(candidates.c.rank.desc(), candidates.c.id.desc()).limit(limit + 1).subquery()
+    chatroom_ids = select(func.array_agg(distinct(candidates.c.chatroom_id))).scalar_subquery()
+    # Snippets are only built for the rows on this page
+    rows = (await db.execute(
+        select(
+            page.c.id,
+            page.c.chatroom_id,
+            page.c.sender,
+            func.ts_headline(models.MESSAGE_SEARCH_CONFIG, page.c.content, tsquery, settings.SEARCH_SNIPPET_OPTIONS).label("snippet"),
+            page.c.rank,
+            page.c.created_at,
+            chatroom_ids.label("chatroom_ids"),
+        ).order_by(page.c.rank.desc(), page.c.id.desc())
+    )).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [{k: row[k] for k in ("id", "chatroom_id", "sender", "snippet", "rank", "created_at")} for row in rows]
+    next_cursor = f"{rows[-1]['rank']!r}:{rows[-1]['id']}" if has_more else None
+    all_chatroom_ids = sorted(rows[0]["chatroom_ids"]) if rows else []
+    return _json_response(orjson.dumps({"items": items, "chatroom_ids": all_chatroom_ids, "next_cursor": next_cursor}))
+
+@router.get("/{id}", response_model=schemas.ChatroomOut)
+async def get_chatroom(id: int, access_token: str = Query(...), db: AsyncSession = Depends(deps.get_db)):
+    """
+    Retrieve a specific chatroom by ID for the current user.
+    """
+    # Get current user from access token
+    current_user = await deps.get_current_user_from_query(access_token, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    return chatroom
+
+@router.get("/{id}/messages", response_model=schemas.MessagePage)
+async def list_messages(
+    id: int,
+    access_token: str = Query(...),
+    before: Optional[int] = Query(None, description="Return messages older than this message id"),
+    after: Optional[int] = Query(None, description="Return messages newer than this message id"),
+    limit: int = Query(settings.MESSAGES_PAGE_SIZE, ge=1, le=settings.MESSAGES_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(deps.get_db),
+):
+    """
+    Page through a chatroom's messages using keyset pagination on (chatroom_id, id).
+    Without a cursor the newest page is returned. Items are always ordered oldest first.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    # Get current user from access token
+    current_user = await deps.get_current_user_from_query(access_token, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    query = (
+        select(models.Message.id, models.Message.sender, models.Message.content, models.Message.created_at)
+        .filter(models.Message.chatroom_id == id)
+    )
+    # Fetch one extra row to learn whether another page exists
+    if after is not None:
+        rows = (await db.execute(query.filter(models.Message.id > after).order_by(models.Message.id.asc()).limit(limit + 1))).mappings().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        if before is not None:
+            query = query.filter(models.Message.id < before)
+        rows = (await db.execute(query.order_by(models.Message.id.desc()).limit(limit + 1))).mappings().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+    if after is not None:
+        prev_cursor = rows[0]["id"] if rows else None
+        next_cursor = rows[-1]["id"] if has_more else None
+    else:
+        prev_cursor = rows[0]["id"] if has_more else None
+        next_cursor = rows[-1]["id"] if before is not None and rows else None
+    # Rows already have the MessageOut fields, so serialize them straight to bytes
+    return _json_response(orjson.dumps({"items": [dict(row) for row in rows], "prev_cursor": prev_cursor, "next_cursor": next_cursor}))
+
+def _gemini_unavailable(exc: GeminiError) -> HTTPException:
+    """
+    503 for a Gemini call that failed, with Retry-After when Gemini or the breaker gave a hint.
+    """
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after is not None else None
+    return HTTPException(status_code=503, detail="Gemini is unavailable, try again shortly", headers=headers)
+
+@router.post("/{id}/message", response_model=schemas.MessageOut)
+async def send_message(id: int, msg: schemas.MessageCreate, db: AsyncSession = Depends(deps.get_db)):
+    """
+    Send a message to a chatroom and get a Gemini AI response.
+    """
+    # Get current user from schema
+    current_user = await deps.get_current_user_from_schema(msg, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    # Prior turns, read before the new message is recorded
+    history = await build_history(db, id)
+    # Save user message (group-committed with concurrent requests)
+    await record_message(id, await save_message(id, "user", msg.content))
+    # Call Gemini API without blocking the event loop; failures are reported, never saved as replies
+    try:
+        gemini_response = await acall_gemini_api(msg.content, history)
+    except GeminiError as exc:
+        raise _gemini_unavailable(exc)
+    ai_msg = await save_message(id, "gemini", gemini_response)
+    await record_message(id, ai_msg)
+    return ai_msg
+
+def _sse_event(event: str, data: dict) -> str:
+    """
+    Format a single Server-Sent Events frame.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_reply(chatroom_id: int, content: str, history):
+    """
+    Forward Gemini chunks as SSE frames, then persist the full reply as one message.
+    If Gemini fails, an `error` frame ends the stream and nothing is saved.
+    """
+    parts = []
+    try:
+        async for text in astream_gemini_api(content, history):
+            parts.append(text)
+            yield _sse_event("chunk", {"text": text})
+    except GeminiError as exc:
+        yield _sse_event("error", {"message": "Gemini is unavailable, try again shortly", "retry_after": exc.retry_after})
+        return
+    # The writer uses its own sessions, so this is safe after the request-scoped one has closed
+    saved = await save_message(chatroom_id, "gemini", "".join(parts))
+    await record_message(chatroom_id, saved)
+    out = schemas.MessageOut(**saved)
+    yield _sse_event("done", out.model_dump(mode="json"))
+
+@router.post("/{id}/message/stream")
+async def stream_message(id: int, msg: schemas.MessageCreate, db: AsyncSession = Depends(deps.get_db)):
+    """
+    Send a message to a chatroom and stream the Gemini AI response as Server-Sent Events.
+    Emits `chunk` events with partial text and a final `done` event with the saved message,
+    or an `error` event if Gemini fails.
+    """
+    # Get current user from schema
+    current_user = await deps.get_current_user_from_schema(msg, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    history = await build_history(db, id)
+    # Save user message
+    await record_message(id, await save_message(id, "user", msg.content))
+    return StreamingResponse(
+        _stream_reply(id, msg.content, history),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _stream_batch(chatroom_id: int, prompts: List[str], history):
+    """
+    Ask Gemini for every prompt, at most MESSAGE_BATCH_CONCURRENCY at a time, and yield one NDJSON
+    line per reply (or error) in completion order. Once all are in, the answered prompts and their
+    replies are saved together as user/gemini pairs in prompt order, and a final line lists them.
+    """
+    semaphore = asyncio.Semaphore(settings.MESSAGE_BATCH_CONCURRENCY)
+
+    async def answer(index: int, prompt: str):
+        async with semaphore:
+            try:
+                return index, await acall_gemini_api(prompt, history)
+            except GeminiError:
+                return index, None
+
+    tasks = [asyncio.ensure_future(answer(index, prompt)) for index, prompt in enumerate(prompts)]
+    replies = [None] * len(prompts)
+    try:
+        for next_reply in asyncio.as_completed(tasks):
+            index, reply = await next_reply
+            replies[index] = reply
+            if reply is None:
+                yield orjson.dumps({"index": index, "error": "Gemini is unavailable"}) + b"\n"
+            else:
+                yield orjson.dumps({"index": index, "reply": reply}) + b"\n"
+    finally:
+        # Stop outstanding Gemini calls if the client disconnects
+        for task in tasks:
+            task.cancel()
+    messages = [pair for prompt, reply in zip(prompts, replies) if reply is not None for pair in (("user", prompt), ("gemini", reply))]
+    saved = []
+    if messages:
+        saved = await save_messages(chatroom_id, messages)
+        await record_messages(chatroom_id, saved)
+    yield orjson.dumps({"done": True, "messages": saved}) + b"\n"
+
+@router.post("/{id}/messages:batch")
+async def send_message_batch(id: int, batch: schemas.MessageBatchCreate, db: AsyncSession = Depends(deps.get_db)):
+    """
+    Send several independent prompts to a chatroom in one request, each answered with the chatroom's history.
+    Charges the rate limit once for all prompts and streams NDJSON: `{"index", "reply"}` lines in completion
+    order (`{"index", "error"}` for prompts Gemini could not answer, which are not saved), then a
+    `{"done": true, "messages": [...]}` line with the saved user/gemini messages.
+    """
+    if not batch.prompts or len(batch.prompts) > settings.MESSAGE_BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {settings.MESSAGE_BATCH_MAX_PROMPTS} prompts")
+    # Get current user from schema
+    current_user = await deps.get_current_user_from_schema(batch, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    # One atomic check-and-charge for the whole batch; nothing is charged if it does not fit
+    tier = await get_user_tier(current_user.id)
+    result = await check_rate_limit(current_user.id, tier, cost=len(batch.prompts))
+    if result is not None and not result.allowed:
+        return rate_limit_rejection(tier, result)
+    history = await build_history(db, id)
+    return StreamingResponse(
+        _stream_batch(id, batch.prompts, history),
+        media_type="application/x-ndjson",
+        headers=result.headers() if result is not None else None,
+    )
+
+@router.post("/{id}/message/async", response_model=schemas.MessageJobOut, status_code=202)
+async def send_message_async(id: int, msg: schemas.MessageCreate, db: AsyncSession = Depends(deps.get_db)):
+    """
+    Send a message to a chatroom and queue the Gemini AI response on the Celery worker.
+    Returns 202 with a job id to poll at /chatroom/{id}/message/jobs/{job_id}.
+    """
+    # Get current user from schema
+    current_user = await deps.get_current_user_from_schema(msg, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    history = await build_history(db, id)
+    # Save user message
+    await record_message(id, await save_message(id, "user", msg.content))
+    # Enqueue Gemini call; the worker saves the reply
+    job = await run_in_threadpool(gemini_message_task.delay, msg.content, history, id)
+    return schemas.MessageJobOut(job_id=job.id, status="pending")
+
+@router.get("/{id}/message/jobs/{job_id}", response_model=schemas.MessageJobOut)
+async def get_message_job(id: int, job_id: str, access_token: str = Query(...), wait: float = Query(0, ge=0), db: AsyncSession = Depends(deps.get_db)):
+    """
+    Return the status of a queued message job, with the saved Gemini message once completed.
+    With `wait` > 0, long-polls for up to that many seconds (capped by settings) until the job finishes.
+    """
+    # Get current user from access token
+    current_user = await deps.get_current_user_from_query(access_token, db)
+    chatroom = await db.scalar(select(models.Chatroom).filter(models.Chatroom.id == id, models.Chatroom.owner_id == current_user.id))
+    if not chatroom:
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    job = AsyncResult(job_id, app=celery_app)
+    deadline = time.monotonic() + min(wait, settings.MESSAGE_JOB_MAX_WAIT_SECONDS)
+    ready = await run_in_threadpool(job.ready)
+    while not ready and time.monotonic() < deadline:
+        await asyncio.sleep(settings.MESSAGE_JOB_POLL_INTERVAL_SECONDS)
+        ready = await run_in_threadpool(job.ready)
+    if not ready:
+        return schemas.MessageJobOut(job_id=job_id, status="pending")
+    if not job.successful():
+        return schemas.MessageJobOut(job_id=job_id, status="failed")
+    result = job.result
+    # Only expose results that belong to this chatroom
+    if not isinstance(result, dict) or result.get("chatroom_id") != id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    message = schemas.MessageOut(id=result["id"], sender=result["sender"], content=result["content"], created_at=result["created_at"])
+    return schemas.MessageJobOut(job_id=job_id, status="completed", message=message)
@@ -2,9 +2,11 @@
 Handles subscription management, including Stripe checkout, webhook processing, and subscription status queries.
 """
 from fastapi import APIRouter, Depends, Request, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models, schemas, deps, stripe_utils
-from ..database import SessionLocal
+from ..stripe_events import HANDLED_EVENT_TYPES, record_event, process_stripe_event
 from ..config import settings
 
 router = APIRouter(tags=["subscription"])
@@ -13,7 +15,7 @@ class SubscriptionRequest(schemas.BaseModel):
     access_token: str
 
 @router.post("/subscribe/pro", response_model=schemas.APIResponse)
-async def subscribe_pro(req: SubscriptionRequest, db: Session = Depends(deps.get_db)):
+async def subscribe_pro(req: SubscriptionRequest, db: AsyncSession = Depends(deps.get_db)):
     """
     Initiate a Stripe checkout session for upgrading the current user to 'pro' tier.
     """
@@ -23,36 +25,32 @@ async def subscribe_pro(req: SubscriptionRequest, db: Session = Depends(deps.get
     return schemas.APIResponse(status="success", message="Stripe checkout session created", data={"checkout_url": session.url})
 
 @router.post("/webhook/stripe")
-async def stripe_webhook(request: Request, db: Session = Depends(deps.get_db)):
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(deps.get_db)):
     """
-    Handle Stripe webhook events, updating subscription status on successful payment.
+    Handle Stripe webhook events: record each event once and acknowledge it immediately.
+    Subscription changes are applied by the process_stripe_event Celery task.
     """
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     event = stripe_utils.verify_webhook_signature(payload, sig_header)
     if not event:
         raise HTTPException(status_code=400, detail="Invalid webhook signature")
-    # Handle checkout session completion
-    if event["type"] == "checkout.session.completed":
-        user_id = int(event["data"]["object"]["metadata"]["user_id"])
-        sub = db.query(models.Subscription).filter(models.Subscription.user_id == user_id).first()
-        if not sub:
-            sub = models.Subscription(user_id=user_id, tier="pro", status="active")
-            db.add(sub)
-        else:
-            sub.tier = "pro"
-            sub.status = "active"
-        db.commit()
+    if event["type"] not in HANDLED_EVENT_TYPES:
+        return {"status": "ignored"}
+    # Stripe retries and duplicate deliveries hit the unique event id and are not applied twice
+    if not await record_event(db, event, payload):
+        return {"status": "duplicate"}
+    await run_in_threadpool(process_stripe_event.delay, event["id"])
     return {"status": "success"}
 
 @router.get("/subscription/status", response_model=schemas.SubscriptionOut)
-async def subscription_status(access_token: str = Query(...), db: Session = Depends(deps.get_db)):
+async def subscription_status(access_token: str = Query(...), db: AsyncSession = Depends(deps.get_db)):
     """
     Get the current subscription status for the authenticated user.
     """
     # Get current user from access token
     current_user = await deps.get_current_user_from_query(access_token, db)
-    sub = db.query(models.Subscription).filter(models.Subscription.user_id == current_user.id).first()
+    sub = await db.scalar(select(models.Subscription).filter(models.Subscription.user_id == current_user.id))
     if not sub:
         return schemas.SubscriptionOut(tier="basic", status="inactive", started_at=None, ends_at=None)
     return sub 
\ No newline at end of file
@@ -82,6 +82,13 @@ class MessageCreate(MessageBase):
     """
     access_token: str
 
+class MessageBatchCreate(BaseModel):
+    """
+    Schema for batch message requests: independent prompts answered with the same chatroom history.
+    """
+    prompts: List[str]
+    access_token: str
+
 class MessageOut(MessageBase):
     """
     Schema for message output responses.
@@ -92,6 +99,43 @@ class MessageOut(MessageBase):
     class Config:
         orm_mode = True
 
+class MessagePage(BaseModel):
+    """
+    Schema for a page of chatroom messages, oldest first, with keyset cursors.
+    Pass `prev_cursor` as `before` for older messages and `next_cursor` as `after` for newer ones.
+    """
+    items: List[MessageOut]
+    prev_cursor: Optional[int] = None
+    next_cursor: Optional[int] = None
+
+class MessageSearchHit(BaseModel):
+    """
+    Schema for a single message search result with a highlighted snippet.
+    """
+    id: int
+    chatroom_id: int
+    sender: str
+    snippet: str
+    rank: float
+    created_at: datetime
+
+class MessageSearchPage(BaseModel):
+    """
+    Schema for a page of message search results, best match first.
+    Pass `next_cursor` as `cursor` for the next page; `chatroom_ids` lists every chatroom with a match.
+    """
+    items: List[MessageSearchHit]
+    chatroom_ids: List[int]
+    next_cursor: Optional[str] = None
+
+class MessageJobOut(BaseModel):
+    """
+    Schema for queued message job status responses.
+    """
+    job_id: str
+    status: str  # 'pending', 'completed' or 'failed'
+    message: Optional[MessageOut] = None
+
 class SubscriptionOut(BaseModel):
     """
     Schema for subscription status output.
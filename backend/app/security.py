@@ -0,0 +1,96 @@
+"""
+Shared authentication layer: caches verified access tokens as user snapshots, in process and in Redis.
+"""
+import hashlib
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import TTLCache
+from .redis_pool import get_async_redis
+from .config import settings
+from .metrics import track_cache
+from .models import User
+from .utils import decode_access_token
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """
+    Read-only snapshot of the authenticated user's profile, safe to cache.
+    """
+    id: int
+    mobile: str
+    created_at: datetime
+    is_active: bool
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "AuthenticatedUser":
+        data = json.loads(raw)
+        data["created_at"] = datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+        return cls(**data)
+
+    @classmethod
+    def from_model(cls, user: User) -> "AuthenticatedUser":
+        return cls(id=user.id, mobile=user.mobile, created_at=user.created_at, is_active=user.is_active)
+
+# Keyed by token digest; entries never outlive the token's own expiry
+_user_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_ENTRIES, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+track_cache("auth", _user_cache.stats)
+
+def _log(event: str, **fields):
+    """
+    Emit a sampled structured auth log record.
+    """
+    if random.random() < settings.AUTH_LOG_SAMPLE_RATE:
+        logger.info("auth.%s", event, extra={"auth_event": event, **fields})
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def authenticate(token: str, db: AsyncSession, source: str = "schema") -> AuthenticatedUser:
+    """
+    Resolve an access token to a user snapshot.
+    Cached tokens skip both JWT decoding and the User query; raises HTTP 401 if authentication fails.
+    """
+    if not token:
+        _log("missing_token", source=source)
+        raise _credentials_exception()
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    user = _user_cache.get(digest)
+    if user is not None:
+        return user
+    payload = decode_access_token(token)
+    if payload is None or "sub" not in payload:
+        _log("invalid_token", source=source)
+        raise _credentials_exception()
+    remaining = payload["exp"] - time.time() if "exp" in payload else settings.AUTH_CACHE_TTL_SECONDS
+    redis_key = f"auth:token:{digest}"
+    cached = await get_async_redis().get(redis_key)
+    if cached is not None:
+        user = AuthenticatedUser.from_json(cached)
+    else:
+        row = await db.get(User, int(payload["sub"]))
+        if row is None:
+            _log("unknown_user", source=source, user_id=payload["sub"])
+            raise _credentials_exception()
+        user = AuthenticatedUser.from_model(row)
+        if remaining >= 1:
+            await get_async_redis().set(redis_key, user.to_json(), ex=int(remaining))
+    _user_cache.set(digest, user, ttl=min(settings.AUTH_CACHE_TTL_SECONDS, remaining))
+    _log("authenticated", source=source, user_id=user.id)
+    return user
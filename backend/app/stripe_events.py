@@ -0,0 +1,168 @@
+"""
+Stripe webhook ingestion: events are recorded once by Stripe event id, acknowledged, and applied
+to subscriptions by a Celery task, one user at a time and in Stripe creation order.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .redis_pool import get_redis
+from .celery_worker import celery_app
+from .config import settings
+from .database import SessionLocal
+from .models import StripeEvent, Subscription
+from .tiers import invalidate_user_tier_sync
+
+HANDLED_EVENT_TYPES = {
+    "checkout.session.completed",
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+}
+
+# Stripe subscription statuses that grant the pro tier
+ACTIVE_STATUSES = {"active", "trialing"}
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+def _metadata_user_id(obj):
+    """
+    Read our user id from the object's metadata (set when the checkout session is created).
+    `obj` is a plain dict parsed from the stored payload.
+    """
+    user_id = (obj.get("metadata") or {}).get("user_id") or obj.get("client_reference_id")
+    return int(user_id) if user_id else None
+
+async def record_event(db: AsyncSession, event, payload: bytes) -> bool:
+    """
+    Store a verified webhook event. Returns False if the event id was already recorded.
+    Fields are read from the raw payload: SDK event objects do not support dict methods.
+    """
+    data = json.loads(payload)
+    db.add(StripeEvent(
+        event_id=data["id"],
+        type=data["type"],
+        user_id=_metadata_user_id(data["data"]["object"]),
+        payload=payload.decode(),
+        created=_timestamp(data["created"]),
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return True
+
+def _resolve_user_id(db, obj):
+    """
+    Find the user an event belongs to, by metadata or by the Stripe subscription id we stored.
+    """
+    user_id = _metadata_user_id(obj)
+    if user_id is not None:
+        return user_id
+    stripe_subscription_id = obj.get("id") if obj.get("object") == "subscription" else obj.get("subscription")
+    if not stripe_subscription_id:
+        return None
+    return db.scalar(select(Subscription.user_id).filter(Subscription.stripe_subscription_id == stripe_subscription_id))
+
+def _apply_event(sub: Subscription, event: StripeEvent):
+    """
+    Apply one event to the user's subscription row.
+    """
+    obj = json.loads(event.payload)["data"]["object"]
+    if event.type == "checkout.session.completed":
+        sub.tier = "pro"
+        sub.status = "active"
+        sub.stripe_subscription_id = obj.get("subscription") or sub.stripe_subscription_id
+        sub.started_at = sub.started_at or event.created
+    elif event.type in ("customer.subscription.created", "customer.subscription.updated"):
+        sub.status = obj["status"]
+        sub.tier = "pro" if obj["status"] in ACTIVE_STATUSES else "basic"
+        sub.stripe_subscription_id = obj["id"]
+        sub.started_at = _timestamp(obj.get("start_date")) or sub.started_at
+        sub.ends_at = _timestamp(obj.get("cancel_at") or obj.get("current_period_end"))
+    elif event.type == "customer.subscription.deleted":
+        sub.status = "canceled"
+        sub.tier = "basic"
+        sub.ends_at = _timestamp(obj.get("ended_at") or obj.get("canceled_at")) or event.created
+    sub.last_event_at = event.created
+
+def _apply_pending(user_id: int):
+    """
+    Apply every unprocessed event of a user, oldest first. Events older than the last
+    applied one arrived out of order and are marked processed without being applied.
+    """
+    db = SessionLocal()
+    try:
+        events = db.scalars(
+            select(StripeEvent)
+            .filter(StripeEvent.user_id == user_id, StripeEvent.processed_at.is_(None))
+            .order_by(StripeEvent.created, StripeEvent.id)
+        ).all()
+        if not events:
+            return
+        sub = db.scalar(select(Subscription).filter(Subscription.user_id == user_id))
+        if not sub:
+            sub = Subscription(user_id=user_id, tier="basic", status="inactive")
+            db.add(sub)
+        for event in events:
+            if sub.last_event_at is None or event.created >= sub.last_event_at:
+                _apply_event(sub, event)
+            event.processed_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+    # Tier may have changed: drop cached tier on every worker
+    invalidate_user_tier_sync(user_id)
+
+@celery_app.task(bind=True, max_retries=None)
+def process_stripe_event(self, event_id: str):
+    """
+    Celery task to apply a recorded Stripe event, together with any other pending events of the same user.
+    A per-user Redis lock keeps one worker at a time applying a user's events.
+    """
+    db = SessionLocal()
+    try:
+        event = db.scalar(select(StripeEvent).filter(StripeEvent.event_id == event_id))
+        if event is None or event.processed_at is not None:
+            return
+        if event.user_id is None:
+            event.user_id = _resolve_user_id(db, json.loads(event.payload)["data"]["object"])
+            if event.user_id is None:
+                # Not linked to any of our users; nothing to apply
+                event.processed_at = datetime.utcnow()
+            db.commit()
+        if event.processed_at is not None:
+            return
+        user_id = event.user_id
+    finally:
+        db.close()
+    lock = get_redis().lock(f"stripe:user:{user_id}:lock", timeout=settings.STRIPE_EVENT_LOCK_TIMEOUT_SECONDS, blocking_timeout=settings.STRIPE_EVENT_LOCK_TIMEOUT_SECONDS)
+    if not lock.acquire():
+        raise self.retry(countdown=1)
+    try:
+        _apply_pending(user_id)
+    finally:
+        lock.release()
+
+@celery_app.task
+def requeue_stripe_events():
+    """
+    Celery task to re-enqueue events left unprocessed, e.g. when enqueueing after the webhook failed.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.STRIPE_EVENT_REQUEUE_AFTER_SECONDS)
+    db = SessionLocal()
+    try:
+        event_ids = db.scalars(
+            select(StripeEvent.event_id)
+            .filter(StripeEvent.processed_at.is_(None), StripeEvent.received_at < cutoff)
+            .order_by(StripeEvent.created)
+            .limit(settings.STRIPE_EVENT_REQUEUE_BATCH_SIZE)
+        ).all()
+    finally:
+        db.close()
+    for event_id in event_ids:
+        process_stripe_event.delay(event_id)
+    return len(event_ids)
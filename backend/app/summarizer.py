@@ -0,0 +1,121 @@
+"""
+Background summarization of long chatrooms: messages older than the recent-turns window are folded
+into a rolling per-chatroom summary, so Gemini prompts stay bounded however long a chatroom gets.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import func, select
+from .cache import set_summary_cache_sync
+from .celery_worker import celery_app
+from .config import settings
+from .database import SessionLocal
+from .gemini import call_gemini_api
+from .gemini_client import GeminiError
+from .models import ChatroomSummary, Message
+from .redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+SPEAKERS = {"user": "User", "gemini": "Assistant"}
+
+def _summary_prompt(summary: str, rows) -> str:
+    """
+    Ask Gemini to extend the existing summary with a batch of older messages.
+    """
+    transcript = "\n".join(f"{SPEAKERS.get(sender, 'User')}: {content}" for _, sender, content in rows)
+    previous = summary or "(none yet)"
+    return (
+        "You maintain a running summary of a conversation between a user and an AI assistant. "
+        "Update the summary with the new messages below. Keep facts, names, decisions, preferences "
+        f"and open questions; drop small talk. Reply with the summary only, in at most {settings.HISTORY_SUMMARY_MAX_CHARS} characters.\n\n"
+        f"Current summary:\n{previous}\n\nNew messages:\n{transcript}"
+    )
+
+def _recent_limits():
+    """
+    (messages, characters) kept verbatim after a fold. They leave room for the prompt's summary
+    (HISTORY_SUMMARY_MAX_CHARS) and for the messages that arrive before the next refresh is triggered,
+    so every unsummarized turn stays inside the Redis window and build_history's character budget.
+    """
+    messages = settings.HISTORY_MAX_MESSAGES - settings.HISTORY_SUMMARY_EVERY_MESSAGES
+    chars = settings.HISTORY_MAX_CHARS - settings.HISTORY_SUMMARY_MAX_CHARS - settings.HISTORY_SUMMARY_EVERY_CHARS
+    return max(messages, 0), max(chars, 0)
+
+def _fold_boundary(db, chatroom_id: int, through_id: int):
+    """
+    Return the id of the newest message to fold, or None if every unsummarized message
+    still fits in the recent limits.
+    """
+    max_messages, max_chars = _recent_limits()
+    rows = db.execute(
+        select(Message.id, Message.sender, func.length(Message.content))
+        .filter(Message.chatroom_id == chatroom_id, Message.id > through_id)
+        .order_by(Message.id.desc())
+        .limit(max_messages + 1)
+    ).all()
+    kept, chars = 0, 0
+    while kept < len(rows) and kept < max_messages and chars + rows[kept][2] <= max_chars:
+        chars += rows[kept][2]
+        kept += 1
+    # Keep the recent turns starting with a user turn, as trim_history does, so none is dropped from the prompt
+    while kept > 0 and rows[kept - 1][1] != "user":
+        kept -= 1
+    return rows[kept][0] if kept < len(rows) else None
+
+def _summarize(chatroom_id: int) -> int:
+    db = SessionLocal()
+    try:
+        row = db.get(ChatroomSummary, chatroom_id)
+        summary = row.summary if row else ""
+        through_id = row.through_message_id if row else 0
+        boundary = _fold_boundary(db, chatroom_id, through_id)
+        folded = 0
+        # Fold in chunks so a chatroom with a long backlog never builds one oversized prompt
+        while boundary is not None and through_id < boundary:
+            rows = db.execute(
+                select(Message.id, Message.sender, Message.content)
+                .filter(Message.chatroom_id == chatroom_id, Message.id > through_id, Message.id <= boundary)
+                .order_by(Message.id)
+                .limit(settings.HISTORY_SUMMARY_CHUNK_MESSAGES)
+            ).all()
+            if not rows:
+                break
+            try:
+                text = call_gemini_api(_summary_prompt(summary, rows)).strip()
+            except GeminiError as exc:
+                text = ""
+                logger.warning("Summarizing chatroom %s failed after %s messages: %s", chatroom_id, folded, exc)
+            if not text:
+                # Keep what was folded so far; the next trigger picks up from there
+                break
+            summary = text[:settings.HISTORY_SUMMARY_MAX_CHARS]
+            through_id = rows[-1].id
+            folded += len(rows)
+        if not folded:
+            return 0
+        if row is None:
+            row = ChatroomSummary(chatroom_id=chatroom_id)
+            db.add(row)
+        row.summary = summary
+        row.through_message_id = through_id
+        row.updated_at = datetime.utcnow()
+        db.commit()
+        set_summary_cache_sync(chatroom_id, summary, through_id)
+        return folded
+    finally:
+        db.close()
+
+@celery_app.task
+def summarize_chatroom(chatroom_id: int):
+    """
+    Fold a chatroom's messages older than the recent turns kept for the prompt into its stored summary.
+    Queued by history.record_message; returns the number of messages folded.
+    """
+    lock = get_redis().lock(f"chatroom:{chatroom_id}:summary:lock", timeout=settings.HISTORY_SUMMARY_LOCK_TIMEOUT_SECONDS)
+    # Another worker is already summarizing this chatroom and will cover the same messages
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        return _summarize(chatroom_id)
+    finally:
+        lock.release()
@@ -0,0 +1,50 @@
+"""
+Subscription tier resolution for the rate limiter, cached in process and in Redis.
+"""
+from sqlalchemy import select
+from .cache import TTLCache, register_local_cache, invalidation_command
+from .redis_pool import get_async_redis, pipeline, apipeline
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import Subscription
+
+DEFAULT_TIER = "basic"
+
+_tier_cache = TTLCache(maxsize=settings.TIER_CACHE_MAX_ENTRIES, ttl=settings.TIER_CACHE_LOCAL_TTL_SECONDS)
+register_local_cache("tier", _tier_cache)
+
+def _tier_key(user_id: int):
+    return f"user:{user_id}:tier"
+
+async def get_user_tier(user_id: int) -> str:
+    """
+    Return the subscription tier for a user ('basic' if none).
+    Checks the in-process cache, then Redis, and only queries Postgres on a miss in both.
+    """
+    tier = _tier_cache.get(user_id)
+    if tier is not None:
+        return tier
+    cached = await get_async_redis().get(_tier_key(user_id))
+    if cached is not None:
+        tier = cached.decode()
+    else:
+        async with AsyncSessionLocal() as db:
+            tier = await db.scalar(select(Subscription.tier).filter(Subscription.user_id == user_id))
+        tier = tier or DEFAULT_TIER
+        await get_async_redis().set(_tier_key(user_id), tier, ex=settings.TIER_CACHE_TTL_SECONDS)
+    _tier_cache.set(user_id, tier)
+    return tier
+
+async def invalidate_user_tier(user_id: int):
+    """
+    Drop a user's cached tier in Redis and in every worker's in-process cache.
+    """
+    _tier_cache.pop(user_id)
+    await apipeline(("delete", _tier_key(user_id)), invalidation_command("tier", user_id))
+
+def invalidate_user_tier_sync(user_id: int):
+    """
+    Same as invalidate_user_tier, for synchronous callers such as Celery tasks.
+    """
+    _tier_cache.pop(user_id)
+    pipeline(("delete", _tier_key(user_id)), invalidation_command("tier", user_id))
@@ -0,0 +1,112 @@
+"""
+Exercise the resilient Gemini client against the fault-injecting mock server.
+
+Each scenario configures the mock's faults and the client's settings, sends `--calls` generateContent
+requests with `--concurrency` in flight through a fresh GeminiClient and reports the success rate,
+p50/p99 latency, upstream requests per call and how requests were spread over API keys:
+  - 20% 503s without retries, then with retries (jittered backoff, Retry-After)
+  - a per-key budget with one API key, then with a pool of four
+  - a slow 5% tail without hedging, then with hedging
+  - a full outage with the circuit breaker off, then on (fails fast, far fewer upstream calls)
+
+Run from the backend directory (install benchmarks/requirements.txt first):
+    python -m benchmarks.bench_gemini_resilience --calls 200 --concurrency 20 --latency-ms 100
+"""
+import argparse
+import asyncio
+import os
+import time
+
+BASELINE = {
+    "GEMINI_MAX_RETRIES": 0,
+    "GEMINI_API_KEYS": ["bench-key"],
+    "GEMINI_KEY_PER_MINUTE_LIMIT": 0,
+    "GEMINI_KEY_MAX_WAIT_SECONDS": 2,
+    "GEMINI_RETRY_BACKOFF_BASE_SECONDS": 0.05,
+    "GEMINI_RETRY_BACKOFF_CAP_SECONDS": 0.5,
+    "GEMINI_BREAKER_FAILURE_THRESHOLD": 0,
+    "GEMINI_BREAKER_RESET_SECONDS": 30,
+    "GEMINI_HEDGE_AFTER_MS": 0,
+}
+NO_FAULTS = {"error_rate": 0.0, "throttle_rate": 0.0, "key_per_minute": 0, "slow_rate": 0.0, "slow_ms": 0.0, "retry_after": 0.1, "down": False}
+POOL = ["bench-key-a", "bench-key-b", "bench-key-c", "bench-key-d"]
+
+def scenarios(args):
+    """
+    (name, mock faults, client settings) for each scenario.
+    """
+    slow = {"slow_rate": 0.05, "slow_ms": args.latency_ms * 20}
+    budget = {"key_per_minute": args.calls // 4}
+    return [
+        ("503s, no retries", {"error_rate": 0.2}, {}),
+        ("503s, 3 retries", {"error_rate": 0.2}, {"GEMINI_MAX_RETRIES": 3}),
+        ("key budget, 1 key", budget, {"GEMINI_MAX_RETRIES": 3}),
+        ("key budget, 4 keys", budget, {"GEMINI_MAX_RETRIES": 3, "GEMINI_API_KEYS": POOL}),
+        ("slow tail, no hedging", slow, {}),
+        ("slow tail, hedged", slow, {"GEMINI_HEDGE_AFTER_MS": args.latency_ms * 2, "GEMINI_API_KEYS": POOL}),
+        ("outage, no breaker", {"down": True}, {"GEMINI_MAX_RETRIES": 3}),
+        ("outage, breaker", {"down": True}, {"GEMINI_MAX_RETRIES": 3, "GEMINI_BREAKER_FAILURE_THRESHOLD": 5}),
+    ]
+
+async def run_scenario(calls: int, concurrency: int):
+    """
+    Send `calls` requests through a fresh client and return (successes, sorted latencies in ms, seconds).
+    """
+    from app.gemini_client import GeminiClient, GeminiError
+    client = GeminiClient()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    successes = 0
+
+    async def one(i):
+        nonlocal successes
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client.generate_content({"contents": [{"role": "user", "parts": [{"text": f"hello {i}"}]}]})
+                successes += 1
+            except GeminiError:
+                pass
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(calls)))
+    finally:
+        await client.aclose()
+    return successes, sorted(latencies), time.perf_counter() - started
+
+async def main(args):
+    from app.config import settings
+    from benchmarks.mock_gemini import start_mock_gemini
+    server = start_mock_gemini(args.port, args.latency_ms)
+    mock = server.config.app
+    print(f"mock latency {args.latency_ms:.0f} ms, {args.calls} calls, concurrency {args.concurrency}")
+    for name, faults, overrides in scenarios(args):
+        for key, value in {**NO_FAULTS, **faults}.items():
+            setattr(mock.state, key, value)
+        # Start each scenario with fresh counts and per-key budgets
+        mock.state.counts.clear()
+        mock.state.recent.clear()
+        for key, value in {**BASELINE, **overrides}.items():
+            setattr(settings, key, value)
+        successes, latencies, elapsed = await run_scenario(args.calls, args.concurrency)
+        upstream = sum(counts["requests"] for counts in mock.state.counts.values())
+        per_key = " ".join(f"{counts['requests']}" for _, counts in sorted(mock.state.counts.items()))
+        print(
+            f"{name:<24} ok {successes / args.calls:6.1%}  p50 {latencies[len(latencies) // 2]:7.1f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1]:7.1f} ms  {elapsed:5.2f}s  "
+            f"upstream/call {upstream / args.calls:4.2f}  per key [{per_key}]"
+        )
+    server.should_exit = True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    os.environ["GEMINI_API_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1beta"
+    os.environ.setdefault("GEMINI_HTTP2", "false")
+    asyncio.run(main(args))
@@ -0,0 +1,96 @@
+"""
+Benchmark chatroom list serialization for users with many chatrooms.
+
+Compares the CPU cost per request of:
+  - legacy miss: ORM objects -> dicts -> ChatroomOut -> model_dump -> json.dumps for the cache,
+    then response_model validation and JSON encoding by FastAPI
+  - legacy hit: json.loads of the cached blob -> ChatroomOut -> response_model round trip
+  - fast miss: selected column rows -> orjson bytes (cache value and response body)
+  - fast hit: join cached orjson items into the response body
+
+Run from the backend directory:
+    python -m benchmarks.bench_list_chatrooms --chatrooms 1000 5000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+import orjson
+from pydantic import BaseModel, TypeAdapter
+
+class ChatroomOut(BaseModel):
+    # Mirrors app.schemas.ChatroomOut without importing app settings
+    name: str
+    id: int
+    created_at: datetime
+
+class FakeChatroom:
+    # Stand-in for a loaded ORM instance (attributes live in __dict__)
+    def __init__(self, id, name, owner_id, created_at):
+        self.id = id
+        self.name = name
+        self.owner_id = owner_id
+        self.created_at = created_at
+
+response_adapter = TypeAdapter(List[ChatroomOut])
+
+def legacy_miss(objects):
+    def chatroom_to_dict(obj):
+        d = {k: v for k, v in obj.__dict__.items() if not k.startswith('_')}
+        if isinstance(d.get("created_at"), datetime):
+            d["created_at"] = d["created_at"].isoformat()
+        return d
+    result = [ChatroomOut(**chatroom_to_dict(c)) for c in objects]
+    cache_data = []
+    for r in result:
+        d = r.model_dump()
+        for k, v in d.items():
+            if isinstance(v, datetime):
+                d[k] = v.isoformat()
+        cache_data.append(d)
+    json.dumps(cache_data)
+    return response_adapter.dump_json(response_adapter.validate_python(result))
+
+def legacy_hit(blob):
+    cached = json.loads(blob)
+    result = [ChatroomOut(**c) for c in cached]
+    return response_adapter.dump_json(response_adapter.validate_python(result))
+
+def fast_miss(rows):
+    items = [orjson.dumps(row) for row in rows]
+    return b"[" + b",".join(items) + b"]"
+
+def fast_hit(items):
+    return b"[" + b",".join(items) + b"]"
+
+def time_per_call(fn, arg, repeat: int) -> float:
+    fn(arg)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main(sizes, repeat):
+    base = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    for n in sizes:
+        objects = [FakeChatroom(i, f"chatroom {i}", 1, base + timedelta(minutes=i)) for i in range(1, n + 1)]
+        rows = [{"id": o.id, "name": o.name, "created_at": o.created_at} for o in objects]
+        legacy_blob = json.dumps([{"id": o.id, "name": o.name, "created_at": o.created_at.isoformat()} for o in objects])
+        items = [orjson.dumps(row) for row in rows]
+        assert orjson.loads(fast_hit(items)) == orjson.loads(legacy_hit(legacy_blob))
+        print(f"{n} chatrooms (ms per request)")
+        for name, fn, arg in (
+            ("legacy miss", legacy_miss, objects),
+            ("legacy hit", legacy_hit, legacy_blob),
+            ("fast miss", fast_miss, rows),
+            ("fast hit", fast_hit, items),
+        ):
+            print(f"  {name:<12} {time_per_call(fn, arg, repeat):8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chatrooms", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    main(args.chatrooms, args.repeat)
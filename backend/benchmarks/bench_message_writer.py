@@ -0,0 +1,89 @@
+"""
+Benchmark sustained message insert rate: one transaction per message (add, commit, refresh)
+versus the group-commit MessageWriter, at several levels of concurrency.
+
+Uses a throwaway SQLite database by default; set DATABASE_URL to a PostgreSQL URL to measure
+against a real server, where per-transaction fsync makes the difference larger.
+
+Run from the backend directory (install benchmarks/requirements.txt first):
+    python -m benchmarks.bench_message_writer --messages 2000 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def configure_env():
+    """
+    Point the app at a throwaway SQLite database unless DATABASE_URL is already set.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+
+def seed() -> int:
+    """
+    Create the schema, a user and a chatroom, returning the chatroom id.
+    """
+    from app import models
+    from app.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    user = models.User(mobile="+10000000000")
+    db.add(user)
+    db.commit()
+    chatroom = models.Chatroom(name="bench", owner_id=user.id)
+    db.add(chatroom)
+    db.commit()
+    chatroom_id = chatroom.id
+    db.close()
+    return chatroom_id
+
+async def per_message(chatroom_id: int, content: str):
+    from app import models
+    from app.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        msg = models.Message(chatroom_id=chatroom_id, sender="user", content=content)
+        db.add(msg)
+        await db.commit()
+        await db.refresh(msg)
+        return msg.id
+
+async def group_commit(chatroom_id: int, content: str):
+    from app.message_writer import save_message
+    return (await save_message(chatroom_id, "user", content))["id"]
+
+async def run_level(write, chatroom_id: int, total: int, concurrency: int) -> float:
+    """
+    Insert `total` messages with at most `concurrency` writers in flight; return messages per second.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await write(chatroom_id, f"message {i}")
+
+    started = time.perf_counter()
+    ids = await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    assert len(set(ids)) == total
+    return total / elapsed
+
+async def main(total: int, levels):
+    from app.message_writer import close_message_writer
+    chatroom_id = seed()
+    for concurrency in levels:
+        for name, write in (("per-message", per_message), ("group commit", group_commit)):
+            rate = await run_level(write, chatroom_id, total, concurrency)
+            print(f"concurrency {concurrency:>4}  {name:<13} {rate:9.0f} msg/s")
+    await close_message_writer()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    args = parser.parse_args()
+    configure_env()
+    asyncio.run(main(args.messages, args.concurrency))
@@ -0,0 +1,89 @@
+"""
+Microbenchmark of per-request middleware overhead on requests that are not rate limited.
+
+Compares a bare app, the previous BaseHTTPMiddleware-based rate limiter, the pure ASGI
+RateLimitMiddleware and MetricsMiddleware (latency histogram, in-flight gauge, per-request SQL
+counters) by calling the ASGI apps directly (no sockets), so the difference is the middleware's
+own cost.
+
+Run from the backend directory:
+    python -m benchmarks.bench_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+def configure_env():
+    """
+    Provide the settings app.middleware needs at import; no service is contacted.
+    """
+    os.environ.setdefault("DATABASE_URL", "sqlite:///bench-unused.db")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+
+def build_apps():
+    """
+    Return (name, asgi_app) pairs sharing one trivial endpoint.
+    """
+    from starlette.applications import Starlette
+    from starlette.middleware import Middleware
+    from starlette.middleware.base import BaseHTTPMiddleware
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from app.middleware import RateLimitMiddleware
+    from app.metrics import MetricsMiddleware
+
+    class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+        # Pass-through path of the previous implementation
+        async def dispatch(self, request, call_next):
+            if request.url.path.startswith("/chatroom") and request.method == "POST" and "/message" in request.url.path:
+                raise RuntimeError("benchmark only exercises non-limited routes")
+            return await call_next(request)
+
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    routes = [Route("/chatroom/", endpoint, methods=["GET"])]
+    return [
+        ("no middleware", Starlette(routes=routes)),
+        ("BaseHTTPMiddleware", Starlette(routes=routes, middleware=[Middleware(LegacyRateLimitMiddleware)])),
+        ("pure ASGI", Starlette(routes=routes, middleware=[Middleware(RateLimitMiddleware)])),
+        ("metrics", Starlette(routes=routes, middleware=[Middleware(MetricsMiddleware)])),
+    ]
+
+async def time_app(app, requests: int) -> float:
+    """
+    Drive `requests` GET /chatroom/ calls straight through the ASGI interface; return µs per request.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/chatroom/", "raw_path": b"/chatroom/", "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(500):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+async def main(requests: int):
+    results = [(name, await time_app(app, requests)) for name, app in build_apps()]
+    baseline = results[0][1]
+    for name, micros in results:
+        print(f"{name:<20} {micros:8.1f} µs/request  (+{micros - baseline:.1f} µs middleware)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    configure_env()
+    asyncio.run(main(args.requests))
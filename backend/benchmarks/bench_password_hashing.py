@@ -0,0 +1,91 @@
+"""
+Benchmark event-loop responsiveness during a burst of password changes.
+
+A ticker task sleeps for a fixed interval and records how late it wakes up; that lag is
+what every other request on the worker would see. The burst of bcrypt hashes runs:
+  - inline: on the event loop (the old change_password path)
+  - threadpool: through run_in_threadpool without a bound (the old signup path)
+  - process pool: through app.hashing
+Requests rejected with 503 by the hashing pool's backpressure are counted separately.
+
+Run from the backend directory:
+    python -m benchmarks.bench_password_hashing --burst 32 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+def configure_env(rounds: int):
+    """
+    Provide the settings app.utils needs at import; no service is contacted.
+    """
+    os.environ.setdefault("DATABASE_URL", "sqlite:///bench-unused.db")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+    os.environ["BCRYPT_ROUNDS"] = str(rounds)
+
+async def ticker(lags: list, stop: asyncio.Event, interval: float = 0.005):
+    """
+    Record how far past `interval` each sleep overshoots, in ms.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append((loop.time() - started - interval) * 1000)
+
+async def run_burst(name: str, hash_one, burst: int):
+    from fastapi import HTTPException
+
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    rejected = 0
+
+    async def one(i):
+        nonlocal rejected
+        try:
+            await hash_one(f"password-{i}")
+        except HTTPException as exc:
+            if exc.status_code != 503:
+                raise
+            rejected += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(burst)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else (lags[0] if lags else 0.0)
+    print(
+        f"{name:<14} burst {elapsed * 1000:8.0f} ms  loop lag median {statistics.median(lags or [0]):7.1f} ms"
+        f"  p99 {p99:7.1f} ms  max {max(lags or [0]):7.1f} ms  rejected {rejected}"
+    )
+
+async def main(burst: int):
+    from fastapi.concurrency import run_in_threadpool
+    from app import hashing, utils
+
+    async def inline(password):
+        utils.hash_password(password)
+
+    async def threadpool(password):
+        await run_in_threadpool(utils.hash_password, password)
+
+    # Warm up the process pool so worker start-up is not counted
+    await hashing.hash_password("warmup")
+    try:
+        for name, hash_one in (("inline", inline), ("threadpool", threadpool), ("process pool", hashing.hash_password)):
+            await run_burst(name, hash_one, burst)
+    finally:
+        hashing.shutdown_executor()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    configure_env(args.rounds)
+    asyncio.run(main(args.burst))
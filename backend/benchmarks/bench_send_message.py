@@ -0,0 +1,108 @@
+"""
+Benchmark concurrent POST /chatroom/{id}/message throughput against a local mock Gemini server.
+
+With a blocking Gemini call, requests on one worker run one at a time and throughput stays at
+~1/latency regardless of concurrency. With the async pooled client it should scale with concurrency
+up to GEMINI_MAX_CONCURRENCY.
+
+With --batch it also sends the same prompts as one POST /chatroom/{id}/messages:batch request,
+fanned out MESSAGE_BATCH_CONCURRENCY at a time, and reports prompts per second and time to first reply.
+
+Run from the backend directory (install benchmarks/requirements.txt first):
+    python -m benchmarks.bench_send_message --requests 64 --latency-ms 200 --batch
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def configure_env(port: int):
+    """
+    Point the app at a throwaway SQLite database and the local mock Gemini server.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+    os.environ.setdefault("GEMINI_API_KEY", "bench-key")
+    # The batch endpoint always charges the rate limit; lift the basic daily quota for the run
+    os.environ.setdefault("BASIC_DAILY_LIMIT", "0")
+    os.environ["GEMINI_API_BASE_URL"] = f"http://127.0.0.1:{port}/v1beta"
+
+def seed():
+    """
+    Create a user and a chatroom, returning (chatroom_id, access_token).
+    """
+    from app import models, utils
+    from app.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    user = models.User(mobile="+10000000000")
+    db.add(user)
+    db.commit()
+    chatroom = models.Chatroom(name="bench", owner_id=user.id)
+    db.add(chatroom)
+    db.commit()
+    token = utils.create_access_token({"sub": str(user.id)})
+    chatroom_id = chatroom.id
+    db.close()
+    return chatroom_id, token
+
+async def run_level(client, chatroom_id: int, token: str, total: int, concurrency: int) -> float:
+    """
+    Send `total` messages with at most `concurrency` in flight and return requests per second.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            response = await client.post(f"/chatroom/{chatroom_id}/message", json={"content": f"hello {i}", "access_token": token})
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started)
+
+async def run_batch(client, chatroom_id: int, token: str, total: int):
+    """
+    Send `total` prompts as one batch request and return (prompts per second, ms to first reply line).
+    """
+    started = time.perf_counter()
+    first = None
+    lines = 0
+    prompts = [f"hello {i}" for i in range(total)]
+    async with client.stream("POST", f"/chatroom/{chatroom_id}/messages:batch", json={"prompts": prompts, "access_token": token}) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_lines():
+            if first is None:
+                first = (time.perf_counter() - started) * 1000
+            lines += 1
+    assert lines == total + 1, f"expected {total + 1} lines, got {lines}"
+    return total / (time.perf_counter() - started), first
+
+async def main(args):
+    import httpx
+    from app.main import app
+    chatroom_id, token = seed()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"mock latency {args.latency_ms:.0f} ms, {args.requests} requests per level")
+        for concurrency in (1, 4, 16, 64):
+            rps = await run_level(client, chatroom_id, token, args.requests, concurrency)
+            print(f"concurrency={concurrency:<3} {rps:8.1f} req/s")
+        if args.batch:
+            rps, first_ms = await run_batch(client, chatroom_id, token, args.requests)
+            print(f"batch of {args.requests:<5} {rps:8.1f} prompts/s, first reply after {first_ms:.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch", action="store_true", help="also send the prompts as one batch request")
+    args = parser.parse_args()
+    configure_env(args.port)
+    from benchmarks.mock_gemini import start_mock_gemini
+    start_mock_gemini(args.port, args.latency_ms)
+    asyncio.run(main(args))
@@ -0,0 +1,321 @@
+"""
+End-to-end load test of app.main:app against local stand-ins.
+
+Boots the real app in process (httpx ASGITransport, lifespan included) with:
+  - SQLite in a temp dir by default, or any DATABASE_URL via --database-url (e.g. a local Postgres)
+  - fakeredis by default, or a local redis-server via --redis-url
+  - the mock Gemini server from benchmarks.mock_gemini with --gemini-latency-ms
+  - Stripe checkout creation stubbed out (no network)
+  - Celery tasks run eagerly in process (no broker), so summaries triggered by send_message run too
+
+Each virtual user logs in with send-otp/verify-otp, creates a chatroom, then runs a weighted mix of
+operations for --duration seconds. Per endpoint it reports requests, errors, RPS, p50/p95/p99
+latency and mean DB statements and Redis round trips per request. Results are written as JSON
+(named after the current commit by default); pass --compare to diff against an earlier run.
+
+Run from the backend directory (install benchmarks/requirements.txt first):
+    python -m benchmarks.loadtest --users 50 --duration 30
+    python -m benchmarks.loadtest --compare benchmarks/results/loadtest-<commit>.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+DEFAULT_MIX = "login=1,create_chatroom=1,list_chatrooms=4,send_message=4,subscription_status=2,subscribe_pro=0.5"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Per-request call counters; tasks spawned by a request inherit the same dict
+_calls = contextvars.ContextVar("loadtest_calls", default=None)
+
+def configure_env(args):
+    """
+    Point the app at the stand-ins before anything from app is imported.
+    """
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    os.environ["REDIS_URL"] = args.redis_url or "redis://localhost:6379/0"
+    os.environ.setdefault("JWT_SECRET_KEY", "loadtest-secret")
+    os.environ.setdefault("GEMINI_API_KEY", "loadtest-key")
+    os.environ["GEMINI_API_BASE_URL"] = f"http://127.0.0.1:{args.gemini_port}/v1beta"
+    # Keep the rate limiter in the path without letting the daily quota end the run early
+    os.environ.setdefault("BASIC_DAILY_LIMIT", "1000000")
+
+def use_fakeredis():
+    """
+    Swap the shared Redis clients for fakeredis ones sharing one in-memory server.
+    Must run before app modules that import from app.redis_pool.
+    """
+    import fakeredis
+    from app import redis_pool
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    redis_pool.get_redis = lambda: sync_client
+    clients = {}
+
+    def get_async_redis():
+        loop = asyncio.get_running_loop()
+        if loop not in clients:
+            clients[loop] = fakeredis.aioredis.FakeRedis(server=server)
+        return clients[loop]
+
+    redis_pool.get_async_redis = get_async_redis
+
+def stub_stripe():
+    """
+    Make checkout session creation return a canned session instead of calling Stripe.
+    """
+    from types import SimpleNamespace
+    import stripe
+
+    def create(**kwargs):
+        return SimpleNamespace(id="cs_loadtest", url="https://checkout.stripe.test/cs_loadtest")
+
+    stripe.checkout.Session.create = staticmethod(create)
+
+def stub_celery():
+    """
+    Run Celery tasks in process instead of sending them to a broker.
+    """
+    from app.celery_worker import celery_app
+    celery_app.conf.task_always_eager = True
+
+def _count(kind: str):
+    calls = _calls.get()
+    if calls is not None:
+        calls[kind] += 1
+
+def instrument():
+    """
+    Count SQL statements and Redis round trips (a pipeline counts once) per request.
+    """
+    import redis
+    import redis.asyncio
+    from sqlalchemy import event
+    from app.database import get_engine, get_async_engine
+
+    for target in (get_engine(), get_async_engine().sync_engine):
+        event.listen(target, "before_cursor_execute", lambda *args: _count("db"))
+
+    def wrap_sync(cls, name):
+        original = getattr(cls, name)
+
+        def wrapper(self, *args, **kwargs):
+            _count("redis")
+            return original(self, *args, **kwargs)
+        setattr(cls, name, wrapper)
+
+    def wrap_async(cls, name):
+        original = getattr(cls, name)
+
+        async def wrapper(self, *args, **kwargs):
+            _count("redis")
+            return await original(self, *args, **kwargs)
+        setattr(cls, name, wrapper)
+
+    wrap_sync(redis.Redis, "execute_command")
+    wrap_sync(redis.client.Pipeline, "execute")
+    wrap_async(redis.asyncio.Redis, "execute_command")
+    wrap_async(redis.asyncio.client.Pipeline, "execute")
+
+def create_schema():
+    from app.database import init_db
+    init_db()
+
+class Stats:
+    """
+    Latencies and call counts per endpoint.
+    """
+    def __init__(self):
+        self.endpoints = {}
+
+    def record(self, name: str, status: int, elapsed_ms: float, calls: dict):
+        entry = self.endpoints.setdefault(name, {"latencies": [], "errors": 0, "statuses": {}, "db": 0, "redis": 0})
+        entry["latencies"].append(elapsed_ms)
+        entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+        if status >= 400:
+            entry["errors"] += 1
+        entry["db"] += calls["db"]
+        entry["redis"] += calls["redis"]
+
+    def summary(self, elapsed: float) -> dict:
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+        result = {}
+        for name, entry in sorted(self.endpoints.items()):
+            latencies = sorted(entry["latencies"])
+            n = len(latencies)
+            result[name] = {
+                "requests": n,
+                "errors": entry["errors"],
+                "statuses": entry["statuses"],
+                "rps": n / elapsed,
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+                "db_calls_per_request": entry["db"] / n,
+                "redis_calls_per_request": entry["redis"] / n,
+            }
+        return result
+
+class VirtualUser:
+    """
+    One simulated client: logs in, creates a chatroom, then runs weighted operations.
+    """
+    def __init__(self, client, stats: Stats, index: int):
+        self.client = client
+        self.stats = stats
+        self.mobile = f"+1{index:010d}"
+        self.token = None
+        self.chatroom_id = None
+        self.sent = 0
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        calls = {"db": 0, "redis": 0}
+        token = _calls.set(calls)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        finally:
+            _calls.reset(token)
+        self.stats.record(name, response.status_code, (time.perf_counter() - started) * 1000, calls)
+        return response
+
+    async def login(self):
+        response = await self.request("POST /auth/send-otp", "POST", "/auth/send-otp", json={"mobile": self.mobile, "purpose": "login"})
+        otp = response.json()["data"]["otp"]
+        response = await self.request("POST /auth/verify-otp", "POST", "/auth/verify-otp", json={"mobile": self.mobile, "otp_code": otp, "purpose": "login"})
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+
+    async def create_chatroom(self):
+        response = await self.request("POST /chatroom/", "POST", "/chatroom/", json={"name": f"room {self.mobile}", "access_token": self.token})
+        if response.status_code == 200:
+            self.chatroom_id = response.json()["id"]
+
+    async def list_chatrooms(self):
+        await self.request("GET /chatroom/", "GET", "/chatroom/", params={"access_token": self.token})
+
+    async def send_message(self):
+        self.sent += 1
+        await self.request(
+            "POST /chatroom/{id}/message", "POST", f"/chatroom/{self.chatroom_id}/message",
+            json={"content": f"message {self.sent} from {self.mobile}", "access_token": self.token},
+        )
+
+    async def subscription_status(self):
+        await self.request("GET /subscription/status", "GET", "/subscription/status", params={"access_token": self.token})
+
+    async def subscribe_pro(self):
+        await self.request("POST /subscribe/pro", "POST", "/subscribe/pro", json={"access_token": self.token})
+
+    async def run(self, mix, deadline: float):
+        await self.login()
+        await self.create_chatroom()
+        names, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            await getattr(self, random.choices(names, weights)[0])()
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        if name not in ("login", "create_chatroom", "list_chatrooms", "send_message", "subscription_status", "subscribe_pro"):
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        if float(weight) > 0:
+            mix[name] = float(weight)
+    return mix
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(endpoints: dict, baseline: dict = None):
+    print(f"{'endpoint':<30} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'db/req':>7} {'redis/req':>9}")
+    for name, e in endpoints.items():
+        print(
+            f"{name:<30} {e['requests']:>6} {e['errors']:>5} {e['rps']:>8.1f} {e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f}"
+            f" {e['p99_ms']:>8.1f} {e['db_calls_per_request']:>7.2f} {e['redis_calls_per_request']:>9.2f}"
+        )
+        if baseline and name in baseline:
+            b = baseline[name]
+            print(
+                f"{'  vs baseline':<30} {'':>6} {'':>5} {e['rps'] - b['rps']:>+8.1f} {e['p50_ms'] - b['p50_ms']:>+8.1f}"
+                f" {e['p95_ms'] - b['p95_ms']:>+8.1f} {e['p99_ms'] - b['p99_ms']:>+8.1f}"
+                f" {e['db_calls_per_request'] - b['db_calls_per_request']:>+7.2f} {e['redis_calls_per_request'] - b['redis_calls_per_request']:>+9.2f}"
+            )
+
+async def main(args):
+    import httpx
+    from app.main import app
+
+    mix = parse_mix(args.mix)
+    stats = Stats()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            started = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*(VirtualUser(client, stats, i).run(mix, deadline) for i in range(args.users)))
+            elapsed = time.perf_counter() - started
+    endpoints = stats.summary(elapsed)
+    total = sum(e["requests"] for e in endpoints.values())
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "users": args.users, "duration_seconds": args.duration, "mix": mix,
+            "database": "sqlite" if not args.database_url else args.database_url.split(":", 1)[0],
+            "redis": "redis-server" if args.redis_url else "fakeredis",
+            "gemini_latency_ms": args.gemini_latency_ms,
+        },
+        "elapsed_seconds": elapsed,
+        "total_requests": total,
+        "total_rps": total / elapsed,
+        "endpoints": endpoints,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["endpoints"]
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), {args.users} users")
+    print_report(endpoints, baseline)
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{result['commit'][:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--database-url", help="sync SQLAlchemy URL; defaults to a temporary SQLite file")
+    parser.add_argument("--redis-url", help="use a real redis-server instead of fakeredis")
+    parser.add_argument("--gemini-latency-ms", type=float, default=200.0)
+    parser.add_argument("--gemini-port", type=int, default=8765)
+    parser.add_argument("--output", help="results JSON path; defaults to benchmarks/results/loadtest-<commit>.json")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args()
+    configure_env(args)
+    if not args.redis_url:
+        use_fakeredis()
+    stub_stripe()
+    stub_celery()
+    instrument()
+    create_schema()
+    from benchmarks.mock_gemini import start_mock_gemini
+    start_mock_gemini(args.gemini_port, args.gemini_latency_ms)
+    asyncio.run(main(args))
@@ -0,0 +1,128 @@
+"""
+Local mock of the Gemini generateContent and streamGenerateContent APIs with configurable latency, for benchmarks.
+
+Faults can be injected to exercise retries, the circuit breaker, the API-key pool and hedging:
+  - error_rate: fraction of requests answered 503 with Retry-After
+  - throttle_rate: fraction of requests answered 429 with Retry-After
+  - key_per_minute: per-API-key budget; requests over it get 429
+  - slow_rate / slow_ms: fraction of requests delayed by slow_ms instead of the normal latency
+  - down: answer every request 503 (set mock.state.down at runtime to simulate an outage)
+Requests and faults are counted per API key in mock.state.counts; mock.state.recent holds each key's
+request times over the last minute for key_per_minute (clear both to start a fresh run).
+
+Run standalone from the backend directory:
+    python -m benchmarks.mock_gemini --port 8765 --latency-ms 200 --error-rate 0.1 --slow-rate 0.05 --slow-ms 3000
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+import json
+from collections import Counter, defaultdict, deque
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def create_mock_app(latency_ms: float = 200.0, error_rate: float = 0.0, throttle_rate: float = 0.0, key_per_minute: int = 0,
+                    slow_rate: float = 0.0, slow_ms: float = 0.0, retry_after: float = 1.0) -> FastAPI:
+    """
+    Build a FastAPI app that answers generateContent after a fixed delay, with optional injected faults.
+    streamGenerateContent spreads the same delay across one SSE chunk per word.
+    """
+    mock = FastAPI()
+    mock.state.latency_ms = latency_ms
+    mock.state.error_rate = error_rate
+    mock.state.throttle_rate = throttle_rate
+    mock.state.key_per_minute = key_per_minute
+    mock.state.slow_rate = slow_rate
+    mock.state.slow_ms = slow_ms
+    mock.state.retry_after = retry_after
+    mock.state.down = False
+    mock.state.counts = defaultdict(Counter)
+    mock.state.recent = defaultdict(deque)
+
+    def fault(request: Request):
+        """
+        Return an error response to send instead of a reply, or None.
+        """
+        key = request.headers.get("x-goog-api-key", "")
+        counts = mock.state.counts[key]
+        counts["requests"] += 1
+        headers = {"Retry-After": f"{mock.state.retry_after:g}"}
+        if mock.state.down or random.random() < mock.state.error_rate:
+            counts["503"] += 1
+            return JSONResponse(status_code=503, content={"error": {"code": 503, "status": "UNAVAILABLE"}}, headers=headers)
+        now = time.monotonic()
+        window = mock.state.recent[key]
+        while window and window[0] <= now - 60:
+            window.popleft()
+        if random.random() < mock.state.throttle_rate or (mock.state.key_per_minute and len(window) >= mock.state.key_per_minute):
+            counts["429"] += 1
+            return JSONResponse(status_code=429, content={"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, headers=headers)
+        window.append(now)
+        return None
+
+    def delay() -> float:
+        if random.random() < mock.state.slow_rate:
+            return mock.state.slow_ms / 1000
+        return mock.state.latency_ms / 1000
+
+    @mock.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        body = await request.json()
+        error = fault(request)
+        if error is not None:
+            return error
+        prompt = body["contents"][-1]["parts"][0]["text"]
+        await asyncio.sleep(delay())
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": f"echo: {prompt}"}]}}]}
+
+    @mock.post("/v1beta/models/{model}:streamGenerateContent")
+    async def stream_generate_content(model: str, request: Request):
+        body = await request.json()
+        error = fault(request)
+        if error is not None:
+            return error
+        words = f"echo: {body['contents'][-1]['parts'][0]['text']}".split(" ")
+        per_word = delay() / len(words)
+
+        async def chunks():
+            for i, word in enumerate(words):
+                await asyncio.sleep(per_word)
+                text = word if i == 0 else f" {word}"
+                yield f"data: {json.dumps({'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]})}\r\n\r\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return mock
+
+def start_mock_gemini(port: int = 8765, latency_ms: float = 200.0, **faults) -> uvicorn.Server:
+    """
+    Start the mock server on a background thread and wait until it accepts connections.
+    Keyword arguments are the faults of create_mock_app; the mock app is `server.config.app`.
+    Returns the uvicorn server; set `server.should_exit = True` to stop it.
+    """
+    config = uvicorn.Config(create_mock_app(latency_ms, **faults), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, name="mock-gemini", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--key-per-minute", type=int, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+    app = create_mock_app(
+        args.latency_ms, error_rate=args.error_rate, throttle_rate=args.throttle_rate, key_per_minute=args.key_per_minute,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms, retry_after=args.retry_after,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="info")
@@ -0,0 +1,152 @@
+"""
+Replay signed Stripe webhook fixtures against POST /webhook/stripe at a high rate.
+
+Each user gets the lifecycle in fixtures/stripe_events.json (checkout, subscription created,
+past_due, active again, deleted). Every event is delivered `--duplicates` times, and deliveries
+are shuffled so events of one user arrive out of order, as Stripe retries do. Celery runs eagerly
+in process. At the end every subscription must reflect the last event (canceled, basic tier) and
+each event id must be stored exactly once.
+
+Needs a local Redis (per-user lock and tier invalidation). Run from the backend directory
+(install benchmarks/requirements.txt first):
+    python -m benchmarks.replay_stripe_events --users 200 --duplicates 3 --concurrency 50
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import tempfile
+import time
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "stripe_events.json")
+WEBHOOK_SECRET = "whsec_replay"
+
+def configure_env():
+    """
+    Point the app at a throwaway SQLite database and a known webhook secret.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{db_path}")
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+    os.environ["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+
+def render(value, params: dict):
+    """
+    Substitute "{name}" placeholders in a fixture, keeping the parameter's type.
+    """
+    if isinstance(value, dict):
+        return {k: render(v, params) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render(v, params) for v in value]
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return params[value[1:-1]]
+    return value
+
+def build_events(user_ids):
+    """
+    Return serialized Stripe events for every user's lifecycle.
+    """
+    with open(FIXTURES) as f:
+        templates = json.load(f)
+    t0 = int(time.time()) - 3600
+    events = []
+    for user_id in user_ids:
+        params = {"user_id": str(user_id), "subscription_id": f"sub_replay_{user_id}", "t0": t0, "t4": t0 + 4, "t30d": t0 + 30 * 86400}
+        for i, template in enumerate(templates):
+            event = {
+                "id": f"evt_replay_{user_id}_{i}",
+                "object": "event",
+                "type": template["type"],
+                "created": t0 + template["offset_seconds"],
+                "data": {"object": render(template["object"], params)},
+            }
+            events.append(json.dumps(event).encode())
+    return events
+
+def sign(payload: bytes) -> str:
+    """
+    Build a Stripe-Signature header for the payload.
+    """
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def seed(users: int):
+    """
+    Create the schema and the users, returning their ids.
+    """
+    from app import models
+    from app.database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    rows = [models.User(mobile=f"+1{i:010d}") for i in range(users)]
+    db.add_all(rows)
+    db.commit()
+    user_ids = [row.id for row in rows]
+    db.close()
+    return user_ids
+
+def check(user_ids, unique_events: int):
+    """
+    Verify that every event was stored once and applied in order.
+    """
+    from sqlalchemy import func, select
+    from app import models
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        stored = db.scalar(select(func.count()).select_from(models.StripeEvent))
+        pending = db.scalar(select(func.count()).select_from(models.StripeEvent).filter(models.StripeEvent.processed_at.is_(None)))
+        subs = {s.user_id: s for s in db.scalars(select(models.Subscription))}
+    finally:
+        db.close()
+    wrong = [uid for uid in user_ids if uid not in subs or (subs[uid].tier, subs[uid].status) != ("basic", "canceled") or subs[uid].ends_at is None]
+    print(f"stored events {stored}/{unique_events}, unprocessed {pending}, subscriptions in wrong state {len(wrong)}")
+    return stored == unique_events and pending == 0 and not wrong
+
+async def main(users: int, duplicates: int, concurrency: int):
+    import httpx
+    from app.celery_worker import celery_app
+    celery_app.conf.task_always_eager = True
+    from app.main import app
+
+    user_ids = seed(users)
+    events = build_events(user_ids)
+    deliveries = [payload for payload in events for _ in range(duplicates)]
+    random.shuffle(deliveries)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async def deliver(client, payload):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/webhook/stripe", content=payload, headers={"stripe-signature": sign(payload), "content-type": "application/json"})
+            latencies.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+            status = response.json()["status"]
+            statuses[status] = statuses.get(status, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(deliver(client, payload) for payload in deliveries))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{len(deliveries)} deliveries in {elapsed:.2f}s ({len(deliveries) / elapsed:.0f}/s), {statuses}")
+    print(f"webhook latency p50 {latencies[len(latencies) // 2]:.1f} ms  p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f} ms")
+    if not check(user_ids, len(events)):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duplicates", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    configure_env()
+    asyncio.run(main(args.users, args.duplicates, args.concurrency))